@@ -26,17 +26,23 @@
 
 from __future__ import absolute_import, print_function
 
+from collections import defaultdict
+
 import click
 from flask.cli import with_appcontext
 from invenio_base.app import create_cli
 from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
 from hepdata.modules.converter.tasks import convert_and_store
+from hepdata.modules.doi_banner.api import load_doi_map
 from hepdata.modules.records.utils.common import record_exists, get_record_by_id
 from hepdata.modules.submission.models import HEPSubmission
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from .factory import create_app
 from hepdata.config import CFG_PUB_TYPE
-from hepdata.ext.elasticsearch.api import reindex_all, get_records_matching_field
+from hepdata.ext.elasticsearch.api import reindex_all, get_records_matching_values, \
+    reindex_authors as reindex_authors_from_db, rebuild_index
+from hepdata.ext.elasticsearch.incremental import reindex_since
+from hepdata.ext.elasticsearch.index_queue import get_index_queue_stats
 from hepdata.modules.records.utils.submission import unload_submission
 from hepdata.modules.records.migrator.api import load_files, update_submissions, get_all_ids_in_current_system, \
     add_or_update_records_since_date, update_analyses
@@ -195,8 +201,53 @@ def utils():
               help='End recid for the index operation.')
 @click.option('--batch', '-b', type=int, default=50,
               help='Number of records to index at a time.')
-def reindex(recreate, start, end, batch):
-    reindex_all(recreate=recreate, start=start, end=end, batch=batch)
+@click.option('--workers', '-w', type=int, default=1,
+              help='Number of processes indexing records in parallel.')
+@click.option('--resume', '-r', is_flag=True, default=False,
+              help='Continue an interrupted reindex from its checkpoints.')
+@click.option('--bulk-load', '-bl', is_flag=True, default=False,
+              help='Turn off index refreshes and replicas until the reindex is done.')
+@click.option('--since', '-sc', type=str, default=None,
+              help='Only reindex the records changed since this UTC date, e.g. 2016-07-05T10:00, '
+                   'or since the last incremental reindex with "last".')
+@click.option('--rebuild', '-rb', is_flag=True, default=False,
+              help='Build a new index in the background and swap the alias to it when done. '
+                   'Searches keep using the current index meanwhile.')
+def reindex(recreate, start, end, batch, workers, resume, bulk_load, since, rebuild):
+    if since:
+        reindex_since(since=None if since == 'last' else since, batch=batch)
+        return
+
+    if rebuild:
+        new_index = rebuild_index(batch=batch, workers=workers)
+        print('The index alias now points to {0}'.format(new_index))
+        return
+
+    reindex_all(recreate=recreate, start=start, end=end, batch=batch,
+                workers=workers, resume=resume, bulk_load=bulk_load)
+
+
+@utils.command()
+@with_appcontext
+@click.option('--recreate', '-rc', type=bool, default=False,
+              help='Whether or not to recreate the author index mapping as well. '
+                   'This DELETES the author index first.')
+def reindex_authors(recreate):
+    """Rebuilds the author index from the publications in the database."""
+    failures = reindex_authors_from_db(recreate=recreate)
+    if failures:
+        print('{0} authors could not be indexed.'.format(len(failures)))
+
+
+@utils.command()
+@with_appcontext
+def index_queue_stats():
+    """Shows the number of records waiting to be indexed and the delays."""
+    stats = get_index_queue_stats()
+    print('Queued records: {0}'.format(stats['depth']))
+    print('Oldest queued for: {0}s'.format(stats['oldest_age']))
+    print('Latency of the last flush: {0}s'.format(stats['last_latency']))
+    print('Failed records: {0}'.format(stats['failed']))
 
 
 @utils.command()
@@ -207,12 +258,13 @@ def find_duplicates_and_remove():
     """
     inspire_ids = get_all_ids_in_current_system(prepend_id_with="")
 
-    duplicates = []
-    for inspire_id in inspire_ids:
-        matches = get_records_matching_field('inspire_id', inspire_id,
-                                             doc_type=CFG_PUB_TYPE)
-        if len(matches['hits']['hits']) > 1:
-            duplicates.append(matches['hits']['hits'][0]['_source']['recid'])
+    matches = defaultdict(list)
+    for hit in get_records_matching_values('inspire_id', inspire_ids,
+                                           doc_type=CFG_PUB_TYPE,
+                                           source=['inspire_id', 'recid']):
+        matches[hit['_source']['inspire_id']].append(hit['_source']['recid'])
+
+    duplicates = [recids[0] for recids in matches.values() if len(recids) > 1]
     print('There are {} duplicates. Going to remove.'.format(len(duplicates)))
     do_unload(duplicates)
 
@@ -352,6 +404,15 @@ def register_dois(inspire_ids):
         _cleaned_id = inspire_id.replace("ins", "")
         generate_dois_for_submission.delay(inspire_id=_cleaned_id)
 
+
+@doi_utils.command()
+@with_appcontext
+def load_banner_map():
+    """Loads every indexed DOI in the DOI banner map."""
+    count = load_doi_map()
+    print('Loaded {0} DOIs in the DOI banner map.'.format(count))
+
+
 @cli.group()
 def converter():
     """Converter utils"""
@@ -67,6 +67,11 @@ CELERYBEAT_SCHEDULE = {
     'update_analyses': {
         'task': 'hepdata.modules.records.migrator.api.update_analyses',
         'schedule': timedelta(hours=12)
+    },
+
+    'reindex-changed-records': {
+        'task': 'hepdata.ext.elasticsearch.tasks.reindex_changed_records',
+        'schedule': timedelta(minutes=15)
     }
 }
 
@@ -75,6 +80,47 @@ CACHE_KEY_PREFIX = "cache::"
 CACHE_REDIS_URL = "redis://localhost:6379/0"
 CACHE_TYPE = "redis"
 
+# Search results are cached for this many seconds (0 disables the cache).
+SEARCH_CACHE_TTL = 300
+
+# Facets of the empty query are served from a snapshot refreshed after
+# this many seconds (0 computes them with every search).
+SEARCH_FACET_SNAPSHOT_TTL = 3600
+
+# Maximum number of buckets returned by ES for each facet.
+SEARCH_FACET_SIZES = {
+    'author': 10,
+    'collaboration': 50,
+    'subject_areas': 50,
+    'reactions': 50,
+    'observables': 50,
+    'phrases': 50,
+    'cmenergies': 50
+}
+# Facet values found in fewer documents than this are left out. Values are
+# not pruned by count by default: the facets are already limited to their
+# most frequent SEARCH_FACET_SIZES values, and a higher count would empty
+# the keyword facets of small searches.
+SEARCH_FACET_MIN_DOC_COUNT = 1
+
+# Fraction of requests for which the phases of each search are timed, sent
+# back as a Server-Timing header and logged. SEARCH_TIMING_PROFILE also
+# asks ES for its query profile, which is added to the log line.
+SEARCH_TIMING_SAMPLE_RATE = 0.0
+SEARCH_TIMING_PROFILE = False
+
+# DOI banner lookups are kept in process memory for DOI_BANNER_LOCAL_TTL
+# seconds. Unknown DOIs are remembered in REDIS for DOI_BANNER_NEGATIVE_TTL.
+# Once load_doi_map has filled the map, misses are answered without asking
+# ES for DOI_BANNER_MAP_TTL seconds, after which ES is asked again.
+DOI_BANNER_LOCAL_TTL = 60
+DOI_BANNER_NEGATIVE_TTL = 3600
+DOI_BANNER_MAP_TTL = 86400
+
+# Collection counts and latest records on the landing page are cached for
+# this many seconds, or until a record is finalised or removed (0 disables).
+LANDING_PAGE_CACHE_TTL = 3600
+
 # Session
 SESSION_REDIS = "redis://localhost:6379/0"
 
@@ -134,6 +180,23 @@ CFG_SUPPORTED_FORMATS = ['yaml', 'root', 'csv', 'yoda']
 CFG_TMPDIR = tempfile.gettempdir()
 CFG_DATADIR = tempfile.gettempdir()
 
+# Each worker of 'hepdata utils reindex' saves its progress here.
+REINDEX_CHECKPOINT_DIR = os.path.join(CFG_TMPDIR, 'hepdata-reindex')
+# Kept apart so a rebuild does not clear the checkpoints of a manual reindex.
+REBUILD_CHECKPOINT_DIR = os.path.join(CFG_TMPDIR, 'hepdata-rebuild')
+
+# Bulk requests are split when they reach either limit.
+INDEX_BULK_CHUNK_SIZE = 500
+INDEX_BULK_MAX_BYTES = 10 * 1024 * 1024
+
+# Records changed in the web app are queued and indexed together by a
+# Celery task, INDEX_QUEUE_WINDOW seconds after the first of them changed.
+# Records failing to index INDEX_QUEUE_MAX_ATTEMPTS times are not retried.
+INDEX_QUEUE_ENABLED = True
+INDEX_QUEUE_WINDOW = 5
+INDEX_QUEUE_BATCH = 50
+INDEX_QUEUE_MAX_ATTEMPTS = 5
+
 MAIL_SERVER = 'mail.smtp2go.com'
 MAIL_PORT = 2525
 MAIL_DEFAULT_SENDER = 'submissions@hepdata.net'
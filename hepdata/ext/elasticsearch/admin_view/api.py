@@ -23,18 +23,28 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 import logging
+from collections import OrderedDict
 
-from elasticsearch import Elasticsearch
-from elasticsearch_dsl import DocType, String, Date, Integer, Nested, InnerObjectWrapper, Q, Index, Search
+from elasticsearch.helpers import streaming_bulk
+from elasticsearch_dsl import DocType, String, Date, Integer, Nested, InnerObjectWrapper, Q, Index
 from elasticsearch_dsl.connections import connections
 from flask import current_app
+from invenio_db import db
+from invenio_search import current_search_client
+from sqlalchemy import func
 
-from hepdata.modules.records.utils.common import get_record_contents
+from hepdata.config import CFG_PUB_TYPE
+from hepdata.ext.elasticsearch.api import fetch_records
+from hepdata.modules.records.utils.common import get_record_contents, get_records_by_ids
 from hepdata.modules.submission.models import HEPSubmission, DataSubmission
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
 
+# ES 2.x refuses to return hits past index.max_result_window
+MAX_SUMMARY_SIZE = 10000
+DEFAULT_SUMMARY_SIZE = 100
+
 
 class ESSubmissionParticipant(InnerObjectWrapper):
     pass
@@ -83,8 +93,8 @@ class ESSubmission(DocType):
 
 class AdminIndexer:
     def __init__(self, *args, **kwargs):
-        self.client = Elasticsearch(
-            hosts=current_app.config['SEARCH_ELASTIC_HOSTS']) if 'client' not in kwargs else kwargs.get('client')
+        # Share the client, and its connection pool, of the app
+        self.client = kwargs['client'] if 'client' in kwargs else current_search_client._get_current_object()
 
         self.index = kwargs.get('index', current_app.config['SUBMISSION_INDEX'])
 
@@ -105,25 +115,35 @@ class AdminIndexer:
 
         return result
 
-    def get_summary(self):
-        s = Search(index=self.index)
-        s.aggs.bucket('daily_workflows', 'date_histogram',
-                      field='last_updated',
-                      format="yyyy-MM-dd", interval='day') \
-            .bucket('recid', 'terms', field='recid')
-        result = s.execute().aggregations.to_dict()
+    def get_summary(self, from_date=None, to_date=None, offset=0, size=DEFAULT_SUMMARY_SIZE):
+        """
+        Lists the submissions by date of last update, with a single query.
+
+        :param from_date: e.g. '2016-06-01', only submissions updated on or after
+        :param to_date: e.g. '2016-06-30', only submissions updated on or before
+        :param offset: position of the first submission to return
+        :param size: number of submissions to return. offset + size is
+                     limited to MAX_SUMMARY_SIZE
+        :return: list of submission dicts
+        """
+        search = ESSubmission.search(using=self.client, index=self.index)
+
+        date_range = {}
+        if from_date:
+            date_range['gte'] = from_date
+        if to_date:
+            date_range['lte'] = to_date
+        if date_range:
+            search = search.filter('range', last_updated=date_range)
 
-        # flatten summary
-        processed_result = []
-        _daily_workflows = result['daily_workflows']
-        for day in _daily_workflows['buckets']:
-            for recid in day['recid']['buckets']:
-                record_search = self.search(term=recid['key'], fields=['recid'])
-                record = record_search[0] if len(record_search) == 1 else record_search[1]
+        offset = max(0, offset)
+        size = max(0, min(size, MAX_SUMMARY_SIZE - offset))
+        if size == 0:
+            return []
 
-                processed_result.append(record.as_custom_dict(exclude=[]))
+        search = search.sort('last_updated', 'recid')[offset:offset + size]
 
-        return processed_result
+        return [submission.as_custom_dict(exclude=[]) for submission in search.execute()]
 
     def find_and_delete(self, term, fields=None):
         """
@@ -144,42 +164,118 @@ class AdminIndexer:
 
         return delete_count, True
 
-    def index_submission(self, submission):
+    @staticmethod
+    def get_submission_document(submission, record_information, data_count):
+        """
+        :param submission: HEPSubmission
+        :param record_information: contents of the publication record
+        :param data_count: number of data tables of this version
+        :return: fields of the ESSubmission of the submission
+        """
         participants = []
 
         for sub_participant in submission.participants:
             participants.append({'full_name': sub_participant.full_name, 'role': sub_participant.role})
 
+        collaboration = ','.join(record_information.get('collaborations', []))
+
+        return dict(title=record_information['title'],
+                    collaboration=collaboration,
+                    recid=submission.publication_recid,
+                    inspire_id=submission.inspire_id,
+                    status=submission.overall_status,
+                    data_count=data_count,
+                    creation_date=submission.created,
+                    last_updated=submission.last_updated,
+                    version=submission.version,
+                    participants=participants)
+
+    def index_submission(self, submission):
         record_information = get_record_contents(submission.publication_recid)
 
         data_count = DataSubmission.query.filter(DataSubmission.publication_recid == submission.publication_recid,
                                                  DataSubmission.version == submission.version).count()
 
         if record_information:
-            collaboration = ','.join(record_information.get('collaborations', []))
-
             self.add_to_index(_id=submission.publication_recid,
-                              title=record_information['title'],
-                              collaboration=collaboration,
-                              recid=submission.publication_recid,
-                              inspire_id=submission.inspire_id,
-                              status=submission.overall_status,
-                              data_count=data_count,
-                              creation_date=submission.created,
-                              last_updated=submission.last_updated,
-                              version=submission.version,
-                              participants=participants)
+                              **self.get_submission_document(submission, record_information, data_count))
 
-    def reindex(self, *args, **kwargs):
+    @staticmethod
+    def get_data_counts(submissions):
+        """ Counts the data tables of each (recid, version) with one GROUP BY. """
+        recids = set(submission.publication_recid for submission in submissions)
+        if not recids:
+            return {}
+
+        counts = db.session.query(DataSubmission.publication_recid, DataSubmission.version,
+                                  func.count(DataSubmission.id)).filter(
+            DataSubmission.publication_recid.in_(recids)).group_by(
+            DataSubmission.publication_recid, DataSubmission.version)
+
+        return dict(((recid, version), count) for recid, version, count in counts)
+
+    @staticmethod
+    def get_records_information(recids):
+        """ Gets the publication records from ES with one multi-get, and
+        those missing from ES from the database. """
+        records = fetch_records(recids, CFG_PUB_TYPE, include=['title', 'collaborations'])
+
+        missing = [recid for recid in recids if recid not in records]
+        for record in get_records_by_ids(missing):
+            records[int(record['recid'])] = record
+        return records
+
+    def generate_actions(self, submissions):
+        data_counts = self.get_data_counts(submissions)
+        records = self.get_records_information([submission.publication_recid for submission in submissions])
 
+        for submission in submissions:
+            record_information = records.get(submission.publication_recid)
+            if not record_information:
+                continue
+
+            data_count = data_counts.get((submission.publication_recid, submission.version), 0)
+            yield {
+                '_index': self.index,
+                '_type': ESSubmission._doc_type.name,
+                '_id': submission.publication_recid,
+                '_source': self.get_submission_document(submission, record_information, data_count)
+            }
+
+    def reindex(self, *args, **kwargs):
+        """
+        Indexes the latest submission of every record, batch by batch.
+        :param kwargs: recreate [bool] to recreate the index first,
+                       batch [int] number of records per batch
+        :return: list of the failed index operations
+        """
         recreate = kwargs.get('recreate', False)
+        batch = kwargs.get('batch', 500)
         if recreate:
             self.recreate_index()
 
-        submissions = HEPSubmission.query.filter(HEPSubmission.overall_status != 'sandbox').all()
+        submissions = HEPSubmission.query.filter(HEPSubmission.overall_status != 'sandbox').options(
+            db.subqueryload(HEPSubmission.participants)).order_by(
+            HEPSubmission.publication_recid, HEPSubmission.version).all()
 
+        # Only the latest version of each record is kept in the index
+        latest = OrderedDict()
         for submission in submissions:
-            self.index_submission(submission)
+            latest[submission.publication_recid] = submission
+        submissions = list(latest.values())
+
+        failures = []
+        for position in range(0, len(submissions), batch):
+            actions = self.generate_actions(submissions[position:position + batch])
+            for ok, result in streaming_bulk(self.client, actions,
+                                             chunk_size=current_app.config.get('INDEX_BULK_CHUNK_SIZE', 500),
+                                             raise_on_error=False):
+                if not ok:
+                    log.error('Failed to index submission: {0}'.format(result))
+                    failures.append(result)
+
+        self.client.indices.refresh(index=self.index)
+        return failures
 
     def recreate_index(self):
         """ Delete and then create a given index and set a default mapping.
@@ -34,6 +34,10 @@ MAX_OTHER_FACETS = 5
 def parse_aggregations(aggregations):
     facets = []
     for agg_name, agg_res in aggregations.items():
+        # Aggregations wrapped in a filter keep their result under their name
+        if agg_name in agg_res:
+            agg_res = agg_res[agg_name]
+
         if agg_name == 'nested_authors' and 'author_full_names' in agg_res:
             buckets = agg_res['author_full_names']['buckets']
             facets.append(parse_author_aggregations(buckets))
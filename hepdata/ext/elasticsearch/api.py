@@ -17,18 +17,28 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 from __future__ import print_function
 
-from collections import defaultdict
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict, OrderedDict
+from datetime import datetime
 
 from dateutil.parser import parse
 from flask import current_app
 from elasticsearch.exceptions import NotFoundError, RequestError
-from invenio_pidstore.models import RecordIdentifier
-from sqlalchemy import func
-
-from hepdata.ext.elasticsearch.document_enhancers import enhance_data_document, enhance_publication_document
-from .utils import prepare_author_for_indexing
+from elasticsearch.helpers import scan, streaming_bulk
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from hepdata.ext.elasticsearch.cache import bump_index_generation, get_facet_snapshot
+from hepdata.ext.elasticsearch.instrumentation import timed_phase, log_search_timings
+from hepdata.ext.elasticsearch.document_enhancers import enhance_data_document, enhance_publication_document, \
+    build_enhancement_context
+from .utils import get_author_documents, aggregate_keywords
 from hepdata.config import CFG_PUB_TYPE, CFG_DATA_TYPE
-from query_builder import QueryBuilder, get_query_by_type, get_authors_query, HEPDataQueryParser
+from hepdata.modules.submission.models import DataSubmission, Keyword
+from query_builder import QueryBuilder, get_query_by_type, get_authors_query
 from process_results import map_result, merge_results
 from invenio_db import db
 import logging
@@ -36,8 +46,12 @@ import logging
 from invenio_search import current_search_client as es
 
 __all__ = ['search', 'index_record_ids', 'index_record_dict', 'fetch_record',
-           'recreate_index', 'get_record', 'reindex_all',
-           'get_n_latest_records']
+           'fetch_records', 'recreate_index', 'get_record', 'reindex_all',
+           'scroll_search', 'iterate_search', 'suggest_authors',
+           'get_n_latest_records', 'record_exists_matching_field',
+           'count_records_matching_field', 'get_record_matching_field',
+           'get_records_matching_values', 'get_record_ids_matching_field',
+           'get_records_with_field', 'rebuild_index', 'swap_index_alias']
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
@@ -65,7 +79,9 @@ def search(query,
            offset=0,
            sort_field=None,
            sort_order='',
-           post_filter=None):
+           post_filter=None,
+           tables_per_publication=50,
+           scroll=None):
     """ Perform a search query.
 
     :param query: [string] query string e.g. 'higgs boson'
@@ -80,6 +96,12 @@ def search(query,
     :param sort_order: [string] order of the sorting either original
                     (for a particular field) or reversed. Supported:
                     '' or 'rev'
+    :param tables_per_publication: [int] max number of data tables returned
+                    for each publication hit
+    :param scroll: [string] if given, e.g. '1m', the search is kept open for
+                    that long and the result contains a scroll_id which can
+                    be passed to scroll_search to get the following pages.
+                    The offset is ignored and no facets are computed.
 
     :return: [dict] dictionary with processed results and facets
     """
@@ -87,57 +109,132 @@ def search(query,
     if query == '' and not sort_field:
         sort_field = 'date'
 
-    query = HEPDataQueryParser.parse_query(query)
+    # Facets of the unfiltered empty query come from a snapshot
+    use_facet_snapshot = query == '' and not filters and post_filter is None \
+        and not scroll
 
-    # Build core query
-    data_query = get_query_by_type(CFG_DATA_TYPE, query)
-    pub_query = get_query_by_type(CFG_PUB_TYPE, query)
-    authors_query = get_authors_query(query)
+    with timed_phase('build') as timer:
+        # Build core query
+        data_query = get_query_by_type(CFG_DATA_TYPE, query)
+        pub_query = get_query_by_type(CFG_PUB_TYPE, query)
+        authors_query = get_authors_query(query)
 
-    query_builder = QueryBuilder()
-    query_builder.add_child_parent_relation(CFG_DATA_TYPE,
-                                            relation="child",
-                                            related_query=data_query,
-                                            other_queries=[pub_query,
-                                                           authors_query])
-
-    # Add additional options
-    query_builder.add_pagination(size=size, offset=offset)
-    query_builder.add_sorting(sort_field=sort_field, sort_order=sort_order)
-    query_builder.add_filters(filters)
-    query_builder.add_post_filter(post_filter)
-    query_builder.add_aggregations()
-    query_builder.add_source_filter(include, exclude)
+        query_builder = QueryBuilder()
+        query_builder.add_child_parent_relation(CFG_DATA_TYPE,
+                                                relation="child",
+                                                related_query=data_query,
+                                                other_queries=[pub_query,
+                                                               authors_query])
+
+        # Add additional options
+        query_builder.add_pagination(size=size, offset=offset)
+        query_builder.add_sorting(sort_field=sort_field, sort_order=sort_order)
+        query_builder.add_filters(filters)
+        query_builder.add_post_filter(post_filter)
+        if not use_facet_snapshot and not scroll:
+            query_builder.add_aggregations()
+        query_builder.add_source_filter(include, exclude)
+        query_builder.add_child_inner_hits(CFG_DATA_TYPE,
+                                           related_query=data_query,
+                                           size=tables_per_publication)
+
+        search_kwargs = {}
+        if scroll:
+            query_builder.add_pagination(size=size)
+            search_kwargs['scroll'] = scroll
+
+        if timer is not None and timer.profile:
+            query_builder.query['profile'] = True
+
+    with timed_phase('es-search') as timer:
+        pub_result = es.search(index=index,
+                               body=query_builder.query,
+                               doc_type=CFG_PUB_TYPE,
+                               **search_kwargs)
+    if timer is not None:
+        timer.add_es_result('es-search', pub_result)
+
+    with timed_phase('merge'):
+        merged_results = merge_results(pub_result)
+
+    if use_facet_snapshot:
+        with timed_phase('facet-snapshot'):
+            merged_results['aggregations'] = get_facet_snapshot(
+                lambda: get_default_aggregations(index=index))
+
+    result = map_result(merged_results, include=include, exclude=exclude)
+    if scroll:
+        result['scroll_id'] = pub_result.get('_scroll_id')
+
+    log_search_timings(query, filters=filters, size=size, offset=offset,
+                       total=result['total'])
+
+    return result
+
+
+def scroll_search(scroll_id, scroll='1m', include="*", exclude="authors"):
+    """ Get the next page of results of a search started with a scroll.
+
+    :param scroll_id: [string] scroll_id returned with the previous page
+    :param scroll: [string] how long to keep the search open, e.g. '1m'
+    :param include: [string] source fields to include in fetched parents
+    :param exclude: [string] source fields to exclude in fetched parents
+
+    :return: [dict] dictionary with processed results and the next scroll_id
+    """
+    with timed_phase('es-scroll') as timer:
+        pub_result = es.scroll(scroll_id=scroll_id, scroll=scroll)
+    if timer is not None:
+        timer.add_es_result('es-scroll', pub_result)
 
-    pub_result = es.search(index=index,
-                           body=query_builder.query,
-                           doc_type=CFG_PUB_TYPE)
+    result = map_result(merge_results(pub_result),
+                        include=include, exclude=exclude)
+    result['scroll_id'] = pub_result.get('_scroll_id')
 
-    parent_filter = {
-        "filtered": {
-            "filter": {
-                "terms": {
-                    "_id": [hit["_id"] for hit in pub_result['hits']['hits']]
-                }
-            }
-        }
-    }
+    return result
 
-    query_builder = QueryBuilder()
-    query_builder.add_child_parent_relation(CFG_PUB_TYPE,
-                                            relation="parent",
-                                            related_query=parent_filter,
-                                            must=True,
-                                            other_queries=[data_query])
-    query_builder.add_pagination(size=size * 50)
 
-    data_result = es.search(index=index,
-                            body=query_builder.query,
-                            doc_type=CFG_DATA_TYPE)
+@default_index
+def iterate_search(query, index=None, filters=list(), sort_field=None,
+                   sort_order='', page_size=100, scroll='5m'):
+    """ Iterate over all the results of a search, page by page.
+
+    :param query: [string] query string e.g. 'higgs boson'
+    :param index: [string] name of the index. If None a default is used
+    :param filters: [list of tuples] list of filters for the query
+    :param page_size: [int] number of publications fetched per request
+    :param scroll: [string] how long to keep the search open between pages
+
+    :return: generator of publications, each with its data tables
+    """
+    result = search(query, index=index, filters=filters, size=page_size,
+                    sort_field=sort_field, sort_order=sort_order,
+                    scroll=scroll)
+    try:
+        while result['results']:
+            for publication in result['results']:
+                yield publication
+
+            result = scroll_search(result['scroll_id'], scroll=scroll)
+    finally:
+        if result.get('scroll_id'):
+            try:
+                es.clear_scroll(scroll_id=result['scroll_id'])
+            except NotFoundError:
+                pass
 
-    merged_results = merge_results(pub_result, data_result)
 
-    return map_result(merged_results)
+@default_index
+def get_default_aggregations(index=None):
+    """ Compute the facet aggregations over all the publications. """
+    query_builder = QueryBuilder()
+    query_builder.add_pagination(size=0)
+    query_builder.add_aggregations()
+
+    result = es.search(index=index,
+                       body=query_builder.query,
+                       doc_type=CFG_PUB_TYPE)
+    return result.get('aggregations', {})
 
 
 def search_authors(name, size=20):
@@ -161,40 +258,198 @@ def search_authors(name, size=20):
     return [x['_source'] for x in results['hits']['hits']]
 
 
-@default_index
-def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1):
-    """ Recreate the index and add all the records from the db to ES. """
+def suggest_authors(prefix, size=10):
+    """ Suggest author names starting with the given prefix using the
+    completion suggester of the author index. Falls back to the fuzzy
+    author search if there are no suggestions. """
+    from hepdata.config import CFG_ES_AUTHORS
+    index, doc_type = CFG_ES_AUTHORS
 
-    if recreate:
-        recreate_index(index=index)
+    body = {
+        "authors": {
+            "text": prefix,
+            "completion": {
+                "field": "full_name_suggest",
+                "size": size
+            }
+        }
+    }
+
+    try:
+        results = es.suggest(index=index, body=body)
+        options = results['authors'][0]['options'] if results.get('authors') else []
+    except (NotFoundError, RequestError) as e:
+        log.error('Unable to get author suggestions: {0}'.format(e))
+        options = []
+
+    if not options:
+        return search_authors(prefix, size=size)
+
+    return [{'full_name': option['text']} for option in options]
+
+
+def get_existing_recids(start=-1, end=-1):
+    """ Returns the sorted recids which have a registered record, optionally
+    limited to the range start to end (inclusive). """
+    pids = db.session.query(PersistentIdentifier.pid_value).filter(
+        PersistentIdentifier.pid_type == 'recid',
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED)
+
+    recids = sorted(int(pid_value) for pid_value, in pids)
+    return [recid for recid in recids
+            if (start == -1 or recid >= start) and (end == -1 or recid <= end)]
+
+
+def _get_checkpoint_path(checkpoint_dir, worker_id):
+    return os.path.join(checkpoint_dir, 'reindex-{0}.json'.format(worker_id))
+
+
+def _read_checkpoints(checkpoint_dir):
+    checkpoints = []
+    if os.path.isdir(checkpoint_dir):
+        for file_name in sorted(os.listdir(checkpoint_dir)):
+            if file_name.startswith('reindex-') and file_name.endswith('.json'):
+                with open(os.path.join(checkpoint_dir, file_name)) as checkpoint_file:
+                    checkpoints.append(json.load(checkpoint_file))
+    return checkpoints
+
+
+def _write_checkpoint(checkpoint_path, checkpoint):
+    # Write then rename, so an interrupted worker never leaves half a file
+    with open(checkpoint_path + '.tmp', 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.rename(checkpoint_path + '.tmp', checkpoint_path)
 
-    qry = db.session.query(func.max(RecordIdentifier.recid).label("max_recid"),
-                           func.min(RecordIdentifier.recid).label("min_recid"),
-                           )
-    res = qry.one()
-    min_recid = res.min_recid
-    max_recid = res.max_recid
 
-    if max_recid and min_recid:
+def _clear_checkpoints(checkpoint_dir):
+    for checkpoint in _read_checkpoints(checkpoint_dir):
+        os.remove(_get_checkpoint_path(checkpoint_dir, checkpoint['worker']))
 
-        if start != -1:
-            min_recid = max(start, min_recid)
-        if end != -1:
-            max_recid = min(end, max_recid)
-        print('min_recid = {}'.format(min_recid))
-        print('max_recid = {}'.format(max_recid))
 
-        count = min_recid
-        while count <= max_recid:
-            print('Indexing record IDs {0} to {1}'.format(count, min(count + batch - 1, max_recid)))
-            indexed_publications = []
-            rec_ids = range(count, min(count + batch, max_recid + 1))
-            indexed_result = index_record_ids(rec_ids, index=index)
-            indexed_publications += indexed_result[CFG_PUB_TYPE]
-            count += batch
+def _split_recids(recids, workers):
+    """ Splits the recids in contiguous ranges, one per worker. """
+    chunk_size = int(math.ceil(len(recids) / float(workers)))
+    chunks = []
+    for worker_id, position in enumerate(range(0, len(recids), chunk_size)):
+        chunk = recids[position:position + chunk_size]
+        chunks.append({'worker': worker_id, 'first': chunk[0], 'last': chunk[-1],
+                       'last_done': None, 'indexed': 0, 'elapsed': 0})
+    return chunks
+
+
+def _reindex_chunk(checkpoint, index, batch, checkpoint_dir):
+    """ Indexes the recids of one worker range, saving a checkpoint after
+    each batch so the range can be resumed where it stopped. """
+    checkpoint_path = _get_checkpoint_path(checkpoint_dir, checkpoint['worker'])
+    first = checkpoint['first'] if checkpoint['last_done'] is None \
+        else checkpoint['last_done'] + 1
+    recids = get_existing_recids(start=first, end=checkpoint['last'])
+
+    started = time.time() - checkpoint['elapsed']
+    for position in range(0, len(recids), batch):
+        rec_ids = recids[position:position + batch]
+        indexed_result = index_record_ids(rec_ids, index=index, refresh=False)
+
+        checkpoint['last_done'] = rec_ids[-1]
+        checkpoint['indexed'] += len(indexed_result[CFG_PUB_TYPE]) + \
+            len(indexed_result[CFG_DATA_TYPE])
+        checkpoint['elapsed'] = time.time() - started
+        _write_checkpoint(checkpoint_path, checkpoint)
+
+    checkpoint['last_done'] = checkpoint['last']
+    _write_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+def _reindex_worker(args):
+    """ Entry point of the reindex processes, each with its own app,
+    database connections and ES client. """
+    from hepdata.factory import create_app
+
+    app = create_app()
+    with app.app_context():
+        return _reindex_chunk(*args)
+
+
+def _report_progress(checkpoints):
+    """ Prints the documents indexed by all the workers and their rate. The
+    workers run in parallel, so the slowest one gives the elapsed time. """
+    indexed = sum(checkpoint['indexed'] for checkpoint in checkpoints)
+    elapsed = max([checkpoint['elapsed'] for checkpoint in checkpoints] + [0])
+    rate = indexed / elapsed if elapsed else 0
+    done = len([checkpoint for checkpoint in checkpoints
+                if checkpoint['last_done'] == checkpoint['last']])
+    print('Indexed {0} documents in {1:.0f}s ({2:.1f} docs/sec), {3}/{4} ranges done'.format(
+        indexed, elapsed, rate, done, len(checkpoints)))
+
+
+@default_index
+def reindex_all(index=None, recreate=False, batch=50, start=-1, end=-1,
+                workers=1, resume=False, checkpoint_dir=None, bulk_load=False):
+    """ Recreate the index and add all the records from the db to ES.
+
+    Only the recids with a registered record are indexed. They are split
+    in one contiguous range per worker, and each worker saves a checkpoint
+    after every batch in checkpoint_dir.
+
+    :param workers: [int] number of processes indexing in parallel
+    :param resume: [bool] continue from the checkpoints of an interrupted run
+    :param checkpoint_dir: [string] defaults to REINDEX_CHECKPOINT_DIR
+    :param bulk_load: [bool] turn off refreshes and replicas of the index
+                      until all the records are indexed
+    """
+    checkpoint_dir = checkpoint_dir or current_app.config['REINDEX_CHECKPOINT_DIR']
+    if not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+
+    checkpoints = _read_checkpoints(checkpoint_dir) if resume else []
+    if checkpoints:
+        print('Resuming from {0} checkpoints in {1}'.format(len(checkpoints), checkpoint_dir))
+        chunks = [checkpoint for checkpoint in checkpoints
+                  if checkpoint['last_done'] != checkpoint['last']]
+    else:
+        _clear_checkpoints(checkpoint_dir)
+        if recreate:
+            recreate_index(index=index)
+
+        recids = get_existing_recids(start=start, end=end)
+        if not recids:
+            return
+        print('Indexing {0} record IDs from {1} to {2} with {3} worker(s)'.format(
+            len(recids), recids[0], recids[-1], workers))
+        chunks = _split_recids(recids, workers)
+        for chunk in chunks:
+            _write_checkpoint(_get_checkpoint_path(checkpoint_dir, chunk['worker']), chunk)
+
+    previous_settings = prepare_index_for_bulk_load(index=index) if bulk_load else None
+
+    tasks = [(chunk, index, batch, checkpoint_dir) for chunk in chunks]
+    try:
+        if workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(workers, len(tasks)))
+            try:
+                result = pool.map_async(_reindex_worker, tasks)
+                while not result.ready():
+                    result.wait(30)
+                    _report_progress(_read_checkpoints(checkpoint_dir))
+                result.get()
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for task in tasks:
+                _reindex_chunk(*task)
+                _report_progress(_read_checkpoints(checkpoint_dir))
+    finally:
+        if previous_settings:
+            restore_index_settings(previous_settings, index=index)
+        else:
+            es.indices.refresh(index=index)
+            bump_index_generation()
 
-            print('Finished indexing, now pushing data keywords\n######')
-            push_data_keywords(pub_ids=indexed_publications)
+    _report_progress(_read_checkpoints(checkpoint_dir))
+    _clear_checkpoints(checkpoint_dir)
 
 
 @default_index
@@ -240,13 +495,108 @@ def get_records_matching_field(field, id, index=None, doc_type=None, source=None
     return es.search(index=index, doc_type=doc_type, body=query)
 
 
+def _get_term_query(field, value):
+    """ Builds an exact-match filter on one value, or a list of values """
+    if isinstance(value, (list, tuple, set)):
+        return {"constant_score": {"filter": {"terms": {field: list(value)}}}}
+    return {"constant_score": {"filter": {"term": {field: value}}}}
+
+
+@default_index
+def record_exists_matching_field(field, value, index=None, doc_type=None):
+    """
+    Checks if at least one document has exactly the given value for a field.
+    Unlike get_records_matching_field, no documents are fetched and
+    shards stop collecting after the first match.
+
+    :param field: e.g. 'doi' or 'inspire_id'
+    :param value: the exact (non-analyzed) value to look for
+    :return: True if a matching document exists
+    """
+    result = es.search(index=index, doc_type=doc_type,
+                       body={"size": 0, "query": _get_term_query(field, value)},
+                       terminate_after=1)
+    return result['hits']['total'] > 0
+
+
+@default_index
+def count_records_matching_field(field, value, index=None, doc_type=None):
+    """ Returns the number of documents with exactly the given value for a field """
+    result = es.count(index=index, doc_type=doc_type,
+                      body={"query": _get_term_query(field, value)})
+    return result['count']
+
+
+@default_index
+def get_record_matching_field(field, value, index=None, doc_type=None, source=None):
+    """
+    Finds a single document with exactly the given value for a field.
+
+    :param source: optional list of fields to return, e.g. ['recid']
+    :return: the _source of the first match, or None
+    """
+    query = {
+        "size": 1,
+        "query": _get_term_query(field, value)
+    }
+
+    if source is not None:
+        query["_source"] = source
+
+    hits = es.search(index=index, doc_type=doc_type, body=query)['hits']['hits']
+    if hits:
+        return hits[0].get('_source', {})
+    return None
+
+
 @default_index
-def delete_item_from_index(id, index, doc_type, parent=None):
+def get_records_matching_values(field, values, index=None, doc_type=None, source=False):
+    """
+    Batched lookup of every document whose field matches one of the values.
+    Results are streamed with a scan so no query window has to be guessed.
+
+    :param values: list of exact values to look for
+    :param source: list of fields to return, or False for ids only
+    :return: generator of hits, each with _id, _type and (optionally) _source
+    """
+    values = list(values)
+    if not values:
+        return iter([])
+
+    query = {
+        "query": _get_term_query(field, values),
+        "_source": source
+    }
+    return scan(es, query=query, index=index, doc_type=doc_type)
+
+
+@default_index
+def get_record_ids_matching_field(field, value, index=None, doc_type=None):
+    """ Returns the ids of all documents with exactly the given value for a field """
+    return [hit['_id'] for hit in
+            get_records_matching_values(field, [value], index=index, doc_type=doc_type)]
+
+
+@default_index
+def get_records_with_field(field, index=None, doc_type=None, source=False):
+    """ Streams every document which has a value for the given field """
+    query = {
+        "query": {"constant_score": {"filter": {"exists": {"field": field}}}},
+        "_source": source
+    }
+    return scan(es, query=query, index=index, doc_type=doc_type)
+
+
+@default_index
+def delete_item_from_index(id, index, doc_type, parent=None, refresh=True):
     """
     Given an id, deletes an item from the index.
     :param id:
     :param index:
     :param doc_type:
+    :param refresh: [bool] make the deletion visible to searches before
+                    returning. Deleting several items should refresh once
+                    at the end instead.
     :return:
     """
     if parent:
@@ -254,78 +604,55 @@ def delete_item_from_index(id, index, doc_type, parent=None):
     else:
         es.delete(index=index, doc_type=doc_type, id=id)
 
+    # Until the refresh the item is still searchable, so cached searches
+    # are invalidated by whoever refreshes
+    if refresh:
+        refresh_index(index=index)
 
-@default_index
-def push_data_keywords(pub_ids=None, index=None):
-    """ Go through all the publications and their datatables and move data
-     keywords from tables to their parent publications. """
-
-    if not pub_ids:
-        body = {'query': {'match_all': {}}}
-        results = es.search(index=index,
-                            doc_type=CFG_PUB_TYPE,
-                            body=body,
-                            _source=False)
-        pub_ids = [i['_id'] for i in results['hits']['hits']]
-
-    for pub_id in pub_ids:
-        query_builder = QueryBuilder()
-        query_builder.add_child_parent_relation(
-            'publication',
-            relation='parent',
-            must=True,
-            related_query={'match': {'recid': pub_id}}
-        )
-        tables = es.search(
-            index=index,
-            doc_type=CFG_DATA_TYPE,
-            body=query_builder.query,
-            _source_include='keywords'
-        )
-        keywords = [d['_source'].get('keywords', None)
-                    for d in tables['hits']['hits']]
-
-        # Flatten the list
-        keywords = [i for inner in keywords for i in inner]
-
-        # Aggregate
-        agg_keywords = defaultdict(list)
-        for kw in keywords:
-            agg_keywords[kw['name']].append(kw['value'])
-
-        # Remove duplicates
-        for k, v in agg_keywords.items():
-            agg_keywords[k] = list(set(v))
-
-        body = {
-            "doc": {
-                'data_keywords': dict(agg_keywords)
-            }
-        }
 
-        try:
-            es.update(index=index, doc_type=CFG_PUB_TYPE, id=pub_id, body=body)
-        except Exception as e:
-            log.error(e.message)
+@default_index
+def refresh_index(index=None):
+    """ Makes the latest changes to the index visible to searches and
+    invalidates the cached searches. """
+    es.indices.refresh(index=index)
+    bump_index_generation()
 
 
-@default_index
-def index_record_ids(record_ids, index=None):
-    """ Index records given in the argument.
+def get_data_keywords(publications):
+    """ Aggregates the keywords of the data tables of each publication,
+    for the version being indexed, with a single query.
 
-    :param record_ids: [list of ints] list of record ids e.g. [1, 5, 2, 3]
-    :param index: [string] name of the index. If None a default is used
-    :return: list of indexed publication and data recids
+    :param publications: [list of dicts] publication records
+    :return: [dict] e.g. {1: {'reactions': ['P P --> TOP TOPBAR X']}}
     """
-    from hepdata.modules.records.utils.common import get_record_by_id
+    versions = dict((doc['recid'], doc['version']) for doc in publications)
+    if not versions:
+        return {}
 
-    docs = filter(None, [get_record_by_id(recid) for recid in record_ids])
+    rows = db.session.query(DataSubmission.publication_recid, DataSubmission.version,
+                            Keyword.name, Keyword.value) \
+        .join(DataSubmission.keywords) \
+        .filter(DataSubmission.publication_recid.in_(versions.keys())) \
+        .order_by(DataSubmission.id)
 
-    existing_record_ids = [doc['recid'] for doc in docs]
-    print('Indexing existing record IDs:', existing_record_ids)
+    keywords = defaultdict(list)
+    for recid, version, name, value in rows:
+        if versions[recid] == version:
+            keywords[recid].append({'name': name, 'value': value})
 
-    to_index = []
-    indexed_result = {CFG_DATA_TYPE: [], CFG_PUB_TYPE: []}
+    return dict((recid, aggregate_keywords(keywords[recid])) for recid in versions)
+
+
+def generate_index_actions(docs, index, indexed_result):
+    """ Yields the bulk actions indexing the given records and their authors.
+
+    :param docs: [list of Records] publication and data records
+    :param index: [string] name of the index
+    :param indexed_result: [dict] filled with the recids of each type
+    """
+    publications = [doc for doc in docs if 'related_publication' not in doc and 'version' in doc]
+    data_keywords = get_data_keywords(publications)
+    enhancement_context = build_enhancement_context([doc['recid'] for doc in publications])
 
     for doc in docs:
         if 'related_publication' in doc:
@@ -336,17 +663,14 @@ def index_record_ids(record_ids, index=None):
 
             enhance_data_document(doc)
 
-            op_dict = {
-                "index": {
-                    "_index": index,
-                    "_type": CFG_DATA_TYPE,
-                    "_id": doc['recid'],
-                    "_parent": str(doc['related_publication'])
-                }
+            action = {
+                "_index": index,
+                "_type": CFG_DATA_TYPE,
+                "_id": doc['recid'],
+                "_parent": str(doc['related_publication'])
             }
 
             indexed_result[CFG_DATA_TYPE].append(doc['recid'])
-            to_index.append(op_dict)
 
         else:
 
@@ -354,32 +678,176 @@ def index_record_ids(record_ids, index=None):
                 print('Skipping unfinished record ID {}'.format(doc['recid']))
                 continue
 
-            author_docs = prepare_author_for_indexing(doc)
-            to_index += author_docs
-
-            enhance_publication_document(doc)
+            enhance_publication_document(doc, enhancement_context)
+            doc['data_keywords'] = data_keywords.get(doc['recid'], {})
 
-            op_dict = {
-                "index": {
-                    "_index": index,
-                    "_type": CFG_PUB_TYPE,
-                    "_id": doc['recid']
-                }
+            action = {
+                "_index": index,
+                "_type": CFG_PUB_TYPE,
+                "_id": doc['recid']
             }
 
             indexed_result[CFG_PUB_TYPE].append(doc['recid'])
-            to_index.append(op_dict)
 
         if doc["last_updated"] is not None:
             doc["last_updated"] = parse(doc["last_updated"]).isoformat()
-        to_index.append(doc)
+        action['_source'] = doc
+        yield action
+
+    authors = get_changed_author_documents(get_author_documents(publications))
+    for author_action in generate_author_actions(authors.values()):
+        yield author_action
+
+
+def generate_author_actions(author_docs):
+    index, doc_type = current_app.config['CFG_ES_AUTHORS']
+    for author_doc in author_docs:
+        yield {
+            "_index": index,
+            "_type": doc_type,
+            "_id": author_doc['full_name'],
+            "_source": author_doc
+        }
+
+
+def get_changed_author_documents(authors, chunk_size=1000):
+    """ Leaves out the authors whose indexed document has the same
+    content hash.
+
+    :param authors: [dict] author documents keyed by full name
+    :return: [dict] the authors which are new or have changed
+    """
+    index, doc_type = current_app.config['CFG_ES_AUTHORS']
+    names = list(authors.keys())
+    changed = OrderedDict()
+    for position in range(0, len(names), chunk_size):
+        chunk = names[position:position + chunk_size]
+        try:
+            docs = es.mget(index=index, doc_type=doc_type, body={"ids": chunk},
+                           _source_include='content_hash')['docs']
+        except NotFoundError:
+            docs = []
+        indexed_hashes = dict((doc['_id'], doc['_source'].get('content_hash'))
+                              for doc in docs if doc.get('found'))
+        for name in chunk:
+            if indexed_hashes.get(name) != authors[name]['content_hash']:
+                changed[name] = authors[name]
+    return changed
+
+
+def reindex_authors(recreate=False, batch=100):
+    """ Rebuilds the author index from the publications in the database,
+    sending each distinct author once.
+
+    :param recreate: [bool] delete and create the author index first
+    :param batch: [int] number of records loaded from the database at a time
+    """
+    from invenio_records.models import RecordMetadata
+
+    if recreate:
+        recreate_authors_index()
+
+    def generate_actions():
+        seen = set()
+        records = RecordMetadata.query.filter(
+            RecordMetadata.json.isnot(None)).yield_per(batch)
+        for record in records:
+            if 'related_publication' in record.json or 'version' not in record.json:
+                continue
+            authors = get_author_documents([record.json])
+            new_authors = [authors[name] for name in authors if name not in seen]
+            seen.update(authors.keys())
+            for action in generate_author_actions(new_authors):
+                yield action
+        print('Indexed {0} distinct authors'.format(len(seen)))
+
+    failures = bulk_index(generate_actions())
+    es.indices.refresh(index=current_app.config['CFG_ES_AUTHORS'][0])
+    return failures
 
-    if to_index:
-        es.bulk(index=index, body=to_index, refresh=True)
+
+def bulk_index(actions):
+    """ Sends the actions to ES in chunks bounded by INDEX_BULK_CHUNK_SIZE
+    actions and INDEX_BULK_MAX_BYTES bytes.
+
+    :param actions: iterable of bulk actions
+    :return: [list] the items ES failed to index, each as returned by ES
+    """
+    failures = []
+    for ok, item in streaming_bulk(
+            es, actions,
+            chunk_size=current_app.config.get('INDEX_BULK_CHUNK_SIZE', 500),
+            max_chunk_bytes=current_app.config.get('INDEX_BULK_MAX_BYTES', 10 * 1024 * 1024),
+            raise_on_error=False):
+        if not ok:
+            failures.append(item)
+            for op_type, result in item.items():
+                log.error('Unable to {0} {1} {2}: {3}'.format(
+                    op_type, result.get('_type'), result.get('_id'), result.get('error')))
+    return failures
+
+
+@default_index
+def index_record_ids(record_ids, index=None, refresh=True):
+    """ Index records given in the argument.
+
+    :param record_ids: [list of ints] list of record ids e.g. [1, 5, 2, 3]
+    :param index: [string] name of the index. If None a default is used
+    :param refresh: [bool] make the records searchable before returning.
+                    Bulk loads should refresh once at the end instead.
+    :return: list of indexed publication and data recids
+    """
+    from hepdata.modules.records.utils.common import get_records_by_ids
+
+    docs = get_records_by_ids(record_ids)
+
+    existing_record_ids = [doc['recid'] for doc in docs]
+    print('Indexing existing record IDs:', existing_record_ids)
+
+    indexed_result = {CFG_DATA_TYPE: [], CFG_PUB_TYPE: []}
+    failures = bulk_index(generate_index_actions(docs, index, indexed_result))
+
+    for item in failures:
+        for result in item.values():
+            if result.get('_type') in indexed_result and result.get('_id') is not None \
+                    and int(result['_id']) in indexed_result[result['_type']]:
+                indexed_result[result['_type']].remove(int(result['_id']))
+
+    # Without a refresh the records are not searchable yet, so cached
+    # searches are invalidated by whoever refreshes at the end of the load
+    if refresh and (indexed_result[CFG_PUB_TYPE] or indexed_result[CFG_DATA_TYPE]):
+        es.indices.refresh(index=[index, current_app.config['CFG_ES_AUTHORS'][0]])
+        bump_index_generation()
 
     return indexed_result
 
 
+@default_index
+def prepare_index_for_bulk_load(index=None):
+    """ Stops refreshing and replicating the index while it is bulk loaded.
+
+    :return: [dict] the previous settings, to pass to restore_index_settings
+    """
+    # The index may be an alias, so take the settings of what it points to
+    settings = list(es.indices.get_settings(index=index).values())[0]['settings']['index']
+    previous_settings = {
+        'refresh_interval': settings.get('refresh_interval', '1s'),
+        'number_of_replicas': settings.get('number_of_replicas')
+    }
+    es.indices.put_settings(index=index, body={
+        'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+    return previous_settings
+
+
+@default_index
+def restore_index_settings(previous_settings, index=None):
+    """ Restores the settings changed by prepare_index_for_bulk_load and
+    makes the loaded documents searchable. """
+    es.indices.put_settings(index=index, body={'index': previous_settings})
+    es.indices.refresh(index=index)
+    bump_index_generation()
+
+
 @default_index
 def index_record_dict(record_dict, doc_type, recid, index=None, parent=None):
     """ Index a given document
@@ -405,15 +873,10 @@ def index_record_dict(record_dict, doc_type, recid, index=None, parent=None):
                         body=record_dict)
 
 
-@default_index
-def recreate_index(index=None):
-    """ Delete and then create a given index and set a default mapping.
-
-    :param index: [string] name of the index. If None a default is used
-    """
+def _get_index_body():
     from config.record_mapping import mapping
 
-    body = {
+    return {
         "mappings": {
             CFG_PUB_TYPE: {
                 "properties": mapping
@@ -427,6 +890,140 @@ def recreate_index(index=None):
         }
     }
 
+
+@default_index
+def recreate_index(index=None):
+    """ Delete and then create a given index and set a default mapping.
+
+    :param index: [string] name of the index. If None a default is used
+    """
+    for existing_index in get_indices_for_alias(index):
+        es.indices.delete(index=existing_index, ignore=404)
+    es.indices.delete(index=index, ignore=404)
+    es.indices.create(index=index, body=_get_index_body())
+    recreate_authors_index()
+    bump_index_generation()
+
+
+def get_indices_for_alias(alias):
+    """ :return: [list] names of the indices the alias points to """
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias).keys())
+
+
+def create_versioned_index(alias):
+    """ Creates an empty index, named after the alias and the current time,
+    with the record mapping.
+
+    :return: [string] name of the new index
+    """
+    index = '{0}-{1}'.format(alias, datetime.utcnow().strftime('%Y%m%d%H%M%S'))
+    es.indices.create(index=index, body=_get_index_body())
+    return index
+
+
+def swap_index_alias(alias, new_index, delete_old=True):
+    """ Points the alias at new_index, in a single atomic request if the
+    alias already exists.
+
+    An index created before versioned indices were introduced has the name
+    of the alias. It is deleted just before the alias is added, so searches
+    fail for that moment during the first swap only.
+
+    :param delete_old: [bool] delete the indices the alias pointed to
+    :return: [list] names of the indices the alias pointed to
+    """
+    old_indices = get_indices_for_alias(alias)
+    if not old_indices and es.indices.exists(index=alias):
+        log.warning('Replacing the index {0} by an alias to {1}'.format(alias, new_index))
+        es.indices.delete(index=alias)
+
+    actions = [{"remove": {"index": old_index, "alias": alias}} for old_index in old_indices]
+    actions.append({"add": {"index": new_index, "alias": alias}})
+    es.indices.update_aliases(body={"actions": actions})
+    bump_index_generation()
+
+    if delete_old:
+        for old_index in old_indices:
+            if old_index != new_index:
+                es.indices.delete(index=old_index, ignore=404)
+    return old_indices
+
+
+@default_index
+def rebuild_index(index=None, batch=50, workers=1):
+    """ Indexes all the records into a new versioned index while searches
+    keep using the current one, then swaps the alias to the new index and
+    indexes again what changed during the rebuild.
+
+    :param index: [string] name of the alias. If None a default is used
+    :return: [string] name of the new index
+    """
+    from hepdata.ext.elasticsearch.incremental import reindex_since, set_high_water_mark
+
+    started = datetime.utcnow()
+    new_index = create_versioned_index(index)
+    print('Building {0}'.format(new_index))
+    try:
+        reindex_all(index=new_index, batch=batch, workers=workers, bulk_load=True,
+                    checkpoint_dir=current_app.config['REBUILD_CHECKPOINT_DIR'])
+    except Exception:
+        es.indices.delete(index=new_index, ignore=404)
+        raise
+
+    swap_index_alias(index, new_index)
+
+    caught_up = datetime.utcnow()
+    reindex_since(since=started, index=index, batch=batch)
+    remove_missing_records(index=index)
+    set_high_water_mark(caught_up)
+    return new_index
+
+
+@default_index
+def remove_missing_records(index=None):
+    """ Deletes the documents of the records which no longer exist, such
+    as those unloaded while the index was being rebuilt.
+
+    :return: [list] recids of the deleted documents
+    """
+    existing_recids = set(get_existing_recids())
+
+    def generate_actions():
+        for hit in scan(es, index=index, doc_type=[CFG_PUB_TYPE, CFG_DATA_TYPE],
+                        query={"query": {"match_all": {}}, "fields": ["_parent"]}):
+            if int(hit['_id']) not in existing_recids:
+                action = {'_op_type': 'delete', '_index': index,
+                          '_type': hit['_type'], '_id': hit['_id']}
+                parent = hit.get('fields', {}).get('_parent')
+                if parent:
+                    action['_parent'] = parent
+                removed.append(int(hit['_id']))
+                yield action
+
+    removed = []
+    bulk_index(generate_actions())
+    if removed:
+        es.indices.refresh(index=index)
+        bump_index_generation()
+        print('Removed {0} records which no longer exist'.format(len(removed)))
+    return removed
+
+
+def recreate_authors_index():
+    """ Delete and then create the author index with its mapping. """
+    from config.record_mapping import author_mapping
+    index, doc_type = current_app.config['CFG_ES_AUTHORS']
+
+    body = {
+        "mappings": {
+            doc_type: {
+                "properties": author_mapping
+            }
+        }
+    }
+
     es.indices.delete(index=index, ignore=404)
     es.indices.create(index=index, body=body)
 
@@ -445,6 +1042,34 @@ def fetch_record(record_id, doc_type, index=None):
     return res.get('_source', res)
 
 
+@default_index
+def fetch_records(record_ids, doc_type, index=None, include=None, exclude=None):
+    """ Fetch several records from ES with a single multi-get request.
+
+    :param record_ids: [list of ints]
+    :param doc_type: [string] document type
+    :param index: [string] name of the index. If None a default is used
+    :param include: [string or list] source fields to include
+    :param exclude: [string or list] source fields to exclude
+
+    :return: [dict] sources of the found records keyed by record id
+    """
+    if not record_ids:
+        return {}
+
+    kwargs = {}
+    if include:
+        kwargs['_source_include'] = include
+    if exclude:
+        kwargs['_source_exclude'] = exclude
+
+    res = es.mget(index=index, doc_type=doc_type,
+                  body={'ids': list(record_ids)}, **kwargs)
+
+    return {int(doc['_id']): doc['_source']
+            for doc in res['docs'] if doc.get('found')}
+
+
 @default_index
 def get_n_latest_records(n_latest, field="last_updated", index=None):
     """ Gets latest N records from the index """
@@ -0,0 +1,140 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Caching of search results in REDIS, invalidated on every index change."""
+
+import hashlib
+import json
+import logging
+
+from flask import current_app
+from redis.exceptions import RedisError
+
+from hepdata.utils.cache import get_cache_client, get_cache_key
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+SEARCH_PARAMETERS = ['q', 'filters', 'size', 'offset',
+                     'sorting_field', 'sorting_order']
+
+
+def get_index_generation():
+    """ Returns the current generation of the index. Every change to the
+    index bumps the generation, which makes older cache entries unreachable.
+    """
+    generation = get_cache_client().get(get_cache_key('search', 'generation'))
+    return int(generation) if generation else 0
+
+
+def bump_index_generation():
+    """ Invalidates all the cached search results. """
+    try:
+        get_cache_client().incr(get_cache_key('search', 'generation'))
+    except RedisError as e:
+        log.error('Unable to invalidate the search cache: {0}'.format(e))
+
+
+def normalise_query_parameters(query_params):
+    """ Keep only the parsed parameters which change the search results. """
+    normalised = {key: query_params.get(key) for key in SEARCH_PARAMETERS}
+    normalised['q'] = (normalised['q'] or '').strip()
+    normalised['filters'] = sorted(
+        [list(search_filter) for search_filter in normalised['filters'] or []])
+    return normalised
+
+
+def get_search_cache_key(query_params, generation):
+    query_hash = hashlib.sha1(json.dumps(
+        normalise_query_parameters(query_params), sort_keys=True)).hexdigest()
+    return get_cache_key('search', 'result', generation, query_hash)
+
+
+def cached_search(query_params, search_function):
+    """ Returns the cached result for the parsed query parameters,
+    calling search_function and caching its result on a miss.
+
+    :param query_params: [dict] output of parse_query_parameters
+    :param search_function: function performing the search
+    :return: [dict] search result
+    """
+    ttl = current_app.config.get('SEARCH_CACHE_TTL', 0)
+    if not ttl:
+        return search_function()
+
+    client = get_cache_client()
+    try:
+        key = get_search_cache_key(query_params, get_index_generation())
+        cached_result = client.get(key)
+        client.incr(get_cache_key('search', 'misses' if cached_result is None else 'hits'))
+    except RedisError as e:
+        log.error('Unable to read from the search cache: {0}'.format(e))
+        return search_function()
+
+    if cached_result is not None:
+        return json.loads(cached_result)
+
+    result = search_function()
+
+    try:
+        client.setex(key, ttl, json.dumps(result))
+    except (RedisError, TypeError, ValueError) as e:
+        log.error('Unable to cache the search result: {0}'.format(e))
+
+    return result
+
+
+def get_facet_snapshot(compute_function):
+    """ Returns the snapshot of the aggregations of the empty query,
+    computing and storing a new one if it has expired or the index changed.
+
+    :param compute_function: function computing the aggregations
+    :return: [dict] ES aggregations
+    """
+    ttl = current_app.config.get('SEARCH_FACET_SNAPSHOT_TTL', 0)
+    if not ttl:
+        return compute_function()
+
+    client = get_cache_client()
+    try:
+        key = get_cache_key('search', 'facets', get_index_generation())
+        snapshot = client.get(key)
+    except RedisError as e:
+        log.error('Unable to read the facet snapshot: {0}'.format(e))
+        return compute_function()
+
+    if snapshot is not None:
+        return json.loads(snapshot)
+
+    aggregations = compute_function()
+
+    try:
+        client.setex(key, ttl, json.dumps(aggregations))
+    except RedisError as e:
+        log.error('Unable to store the facet snapshot: {0}'.format(e))
+
+    return aggregations
+
+
+def get_search_cache_stats():
+    """ Returns the number of search cache hits and misses. """
+    client = get_cache_client()
+    hits = client.get(get_cache_key('search', 'hits'))
+    misses = client.get(get_cache_key('search', 'misses'))
+    return {'hits': int(hits) if hits else 0,
+            'misses': int(misses) if misses else 0}
@@ -17,70 +17,48 @@
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 #
 
+from flask import current_app
+
 from hepdata.config import CFG_DATA_KEYWORDS
 
 
 def default_aggregations():
-    """ Default aggregations used for computing facets """
+    """ Default aggregations used for computing facets.
+    The number of buckets for each facet and their minimum document count
+    are set by SEARCH_FACET_SIZES and SEARCH_FACET_MIN_DOC_COUNT. """
+    facet_sizes = current_app.config.get('SEARCH_FACET_SIZES', {})
+    min_doc_count = current_app.config.get('SEARCH_FACET_MIN_DOC_COUNT', 1)
+
+    def terms(field, facet):
+        return {
+            "terms": {
+                "field": field,
+                "size": facet_sizes.get(facet, 10),
+                "min_doc_count": min_doc_count,
+            }
+        }
+
     return {
         "nested_authors": {
             "nested": {
                 "path": "authors",
             },
             "aggs": {
-                "author_full_names": {
-                    "terms": {
-                        "field": "authors.full_name",
-                    }
-                }
-            }
-        },
-        "collaboration": {
-            "terms": {
-                "field": "collaborations.raw",
-                "size": 0,
-            }
-        },
-        "subject_areas": {
-            "terms": {
-                "field": "subject_area.raw",
-                "size": 0,
+                "author_full_names": terms("authors.full_name", "author")
             }
         },
+        "collaboration": terms("collaborations.raw", "collaboration"),
+        "subject_areas": terms("subject_area.raw", "subject_areas"),
         "dates": {
             "date_histogram": {
                 "field": "publication_date",
                 "interval": "year",
             }
         },
-        "reactions": {
-            "terms": {
-                "field": "data_keywords.reactions.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "observables": {
-            "terms": {
-                "field": "data_keywords.observables.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "phrases": {
-            "terms": {
-                "field": "data_keywords.phrases.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        },
-        "cmenergies": {
-            "terms": {
-                "field": "data_keywords.cmenergies.raw",
-                # "min_doc_count": 2,
-                "size": 0,
-            }
-        }
+        "reactions": terms("data_keywords.reactions.raw", "reactions"),
+        "observables": terms("data_keywords.observables.raw", "observables"),
+        "phrases": terms("data_keywords.phrases.raw", "phrases"),
+        "cmenergies": terms("data_keywords.cmenergies.raw", "cmenergies")
     }
 
 
@@ -198,3 +198,28 @@ mapping = {
         }
     }
 }
+
+author_mapping = {
+    "full_name": {
+        "type": "string"
+    },
+    "first_name": {
+        "type": "string"
+    },
+    "last_name": {
+        "type": "string"
+    },
+    "affiliation": {
+        "type": "string"
+    },
+    "full_name_suggest": {
+        "type": "completion",
+        "analyzer": "simple",
+        "search_analyzer": "simple",
+        "payloads": False
+    },
+    "content_hash": {
+        "type": "string",
+        "index": "no"
+    }
+}
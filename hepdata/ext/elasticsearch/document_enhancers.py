@@ -26,9 +26,13 @@ import datetime
 import logging
 from dateutil.parser import parse
 from flask import current_app
+from invenio_db import db
+from sqlalchemy import func
+from sqlalchemy.orm import subqueryload
 
 from hepdata.modules.permissions.models import SubmissionParticipant
 from hepdata.modules.submission.api import get_latest_hepsubmission
+from hepdata.modules.submission.models import HEPSubmission
 
 FORMATS = ['json', 'root', 'yaml', 'csv', 'yoda']
 
@@ -60,13 +64,51 @@ def add_shortened_authors(doc):
         doc["summary_authors"] = doc["authors"][:10]
 
 
-def add_analyses(doc):
+def build_enhancement_context(recids):
+    """
+    Loads what the publication enhancers need for a batch of publications:
+    the latest submission of each with its resources, and the date of the
+    first participant action. This replaces two queries per document.
+
+    :param recids: publication record ids
+    :return: context to pass to enhance_publication_document
+    """
+    context = {'latest_submissions': {}, 'last_submission_events': {}}
+    if not recids:
+        return context
+
+    hepsubmissions = HEPSubmission.query.filter(
+        HEPSubmission.publication_recid.in_(recids)).options(
+        subqueryload(HEPSubmission.resources)).all()
+
+    for hepsubmission in hepsubmissions:
+        last = context['latest_submissions'].get(hepsubmission.publication_recid)
+        if last is None or hepsubmission.version > last.version:
+            context['latest_submissions'][hepsubmission.publication_recid] = hepsubmission
+
+    action_dates = db.session.query(
+        SubmissionParticipant.publication_recid,
+        func.min(SubmissionParticipant.action_date)).filter(
+        SubmissionParticipant.publication_recid.in_(recids)).group_by(
+        SubmissionParticipant.publication_recid)
+
+    for recid, action_date in action_dates:
+        context['last_submission_events'][recid] = format_submission_event(action_date)
+
+    return context
+
+
+def add_analyses(doc, context=None):
     """
     TODO: Generalise for badges other than Rivet
     :param doc:
+    :param context: optional output of build_enhancement_context
     :return:
     """
-    latest_submission = get_latest_hepsubmission(publication_recid=doc['recid'])
+    if context is not None:
+        latest_submission = context['latest_submissions'].get(doc['recid'])
+    else:
+        latest_submission = get_latest_hepsubmission(publication_recid=doc['recid'])
 
     if latest_submission:
         doc["analyses"] = []
@@ -75,24 +117,32 @@ def add_analyses(doc):
                 doc["analyses"].append({'type': reference.file_type, 'analysis': reference.file_location})
 
 
+def format_submission_event(last_action_date):
+    last_updated = None
+    if last_action_date:
+        try:
+            if last_action_date <= datetime.datetime.now():
+                last_updated = last_action_date.strftime("%Y-%m-%d")
+        except ValueError as ve:
+            print(ve.args)
+    return last_updated
+
+
 def get_last_submission_event(recid):
     submission_participant = SubmissionParticipant.query.filter_by(
         publication_recid=recid).order_by('action_date').first()
     last_updated = None
     if submission_participant:
-        last_action_date = submission_participant.action_date
-        if last_action_date:
-            try:
-                if last_action_date <= datetime.datetime.now():
-                    last_updated = last_action_date.strftime("%Y-%m-%d")
-            except ValueError as ve:
-                print(ve.args)
+        last_updated = format_submission_event(submission_participant.action_date)
     return last_updated
 
 
-def process_last_updates(doc):
+def process_last_updates(doc, context=None):
     if "last_updated" not in doc:
-        last_updated = get_last_submission_event(doc["recid"])
+        if context is not None:
+            last_updated = context['last_submission_events'].get(doc["recid"])
+        else:
+            last_updated = get_last_submission_event(doc["recid"])
         if not last_updated:
             last_updated = doc["creation_date"]
 
@@ -106,8 +156,8 @@ def enhance_data_document(doc):
     add_data_table_urls(doc)
 
 
-def enhance_publication_document(doc):
+def enhance_publication_document(doc, context=None):
     add_data_submission_urls(doc)
     add_shortened_authors(doc)
-    process_last_updates(doc)
-    add_analyses(doc)
+    process_last_updates(doc, context)
+    add_analyses(doc, context)
@@ -0,0 +1,139 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Reindexing of the records changed since a given time.
+
+The time of the last successful run is kept in REDIS as a high-water mark,
+so each run only picks up what changed since the previous one.
+"""
+
+from __future__ import print_function
+
+import calendar
+import logging
+from datetime import datetime
+
+from dateutil.parser import parse
+from dateutil.tz import tzutc
+from flask import current_app
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
+from invenio_records.models import RecordMetadata
+
+from hepdata.ext.elasticsearch.api import default_index, index_record_ids, refresh_index
+from hepdata.modules.submission.models import HEPSubmission, DataResource
+from hepdata.utils.cache import get_cache_client, get_cache_key
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def get_high_water_mark():
+    """ Returns the UTC time up to which all changes have been indexed,
+    or None if no incremental reindex has run yet. """
+    mark = get_cache_client().get(get_cache_key('reindex', 'high_water_mark'))
+    return datetime.strptime(mark, DATE_FORMAT) if mark else None
+
+
+def set_high_water_mark(mark):
+    get_cache_client().set(get_cache_key('reindex', 'high_water_mark'),
+                           mark.strftime(DATE_FORMAT))
+
+
+def _utc_to_local(utc):
+    """ Converts a naive UTC datetime to naive local time, using the UTC
+    offset in force at that time rather than the current one. """
+    return datetime.fromtimestamp(calendar.timegm(utc.timetuple())).replace(
+        microsecond=utc.microsecond)
+
+
+def get_recids_changed_since(since):
+    """
+    Finds the records to reindex: records whose metadata changed, and
+    publications whose submission was updated or received a new resource.
+
+    :param since: [datetime] in UTC
+    :return: [list] sorted recids
+    """
+    # RecordMetadata uses UTC, the submission tables use local time
+    local_since = _utc_to_local(since)
+
+    updated_records = db.session.query(PersistentIdentifier.pid_value).join(
+        RecordMetadata, RecordMetadata.id == PersistentIdentifier.object_uuid).filter(
+        PersistentIdentifier.pid_type == 'recid',
+        RecordMetadata.updated >= since)
+
+    updated_submissions = db.session.query(HEPSubmission.publication_recid).filter(
+        HEPSubmission.last_updated >= local_since)
+
+    new_resources = db.session.query(HEPSubmission.publication_recid).join(
+        HEPSubmission.resources).filter(DataResource.created >= local_since)
+
+    recids = set(int(pid_value) for pid_value, in updated_records)
+    recids.update(recid for recid, in updated_submissions)
+    recids.update(recid for recid, in new_resources)
+    return sorted(recid for recid in recids if recid is not None)
+
+
+@default_index
+def reindex_since(since=None, index=None, batch=50):
+    """
+    Reindexes the records changed since the given time, or since the high-water
+    mark, then moves the high-water mark to the start of this run. A run
+    starting after the high-water mark leaves it alone, since the changes
+    between the two were not indexed.
+
+    :param since: [datetime or string] UTC time unless it has an offset,
+                  defaults to the high-water mark
+    :param index: [string] name of the index. If None a default is used
+    :param batch: [int] number of records to index at a time
+    :return: [int] number of records reindexed, or None if there was no
+             starting point
+    """
+    started = datetime.utcnow()
+    mark = get_high_water_mark()
+
+    if since is None:
+        since = mark
+        if since is None:
+            print('No high-water mark yet: setting it to {0}. Run a full reindex '
+                  'or pass a start date to index earlier changes.'.format(started))
+            set_high_water_mark(started)
+            return None
+    elif not isinstance(since, datetime):
+        since = parse(since)
+
+    # Times with an offset are compared as naive UTC, like the mark
+    if since.tzinfo is not None:
+        since = since.astimezone(tzutc()).replace(tzinfo=None)
+
+    recids = get_recids_changed_since(since)
+    print('{0} records changed since {1}'.format(len(recids), since))
+
+    for position in range(0, len(recids), batch):
+        index_record_ids(recids[position:position + batch], index=index, refresh=False)
+
+    # Make the records searchable and invalidate the cached searches once
+    if recids:
+        refresh_index(index=[index, current_app.config['CFG_ES_AUTHORS'][0]])
+
+    if mark is None or since <= mark:
+        set_high_water_mark(started)
+    return len(recids)
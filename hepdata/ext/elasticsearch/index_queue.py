@@ -0,0 +1,174 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Queue of the records waiting to be reindexed.
+
+The recids are collected in a REDIS set for INDEX_QUEUE_WINDOW seconds, so
+a burst of changes to a record results in a single reindex, then indexed
+together by the flush_index_queue task. Records which fail to index
+INDEX_QUEUE_MAX_ATTEMPTS times are moved to a set of failed records.
+"""
+
+import logging
+import time
+
+from flask import current_app
+from redis.exceptions import RedisError
+
+from hepdata.ext.elasticsearch.api import index_record_ids
+from hepdata.modules.records.utils.landing_page import refresh_landing_page_cache
+from hepdata.utils.cache import get_cache_client, get_cache_key
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+
+def _get_queue_key(*parts):
+    return get_cache_key('index_queue', *parts)
+
+
+def is_index_queue_enabled():
+    """ The queue is bypassed when it is turned off, or when Celery runs
+    the tasks in process, as in the tests. """
+    return current_app.config.get('INDEX_QUEUE_ENABLED', False) and \
+        not current_app.config.get('CELERY_ALWAYS_EAGER', False)
+
+
+def index_now(record_ids):
+    """ Indexes the records in batches of INDEX_QUEUE_BATCH. """
+    batch = current_app.config.get('INDEX_QUEUE_BATCH', 50)
+    for position in range(0, len(record_ids), batch):
+        index_record_ids(record_ids[position:position + batch])
+    refresh_landing_page_cache()
+
+
+def enqueue_record_ids(record_ids):
+    """
+    Queues the records to be reindexed, and schedules a flush of the queue
+    at the end of the window if none is scheduled yet. Records are indexed
+    straight away if the queue is disabled or REDIS is unavailable.
+
+    :param record_ids: [list] of recids
+    """
+    record_ids = [int(recid) for recid in record_ids if recid is not None]
+    if not record_ids:
+        return
+
+    if not is_index_queue_enabled():
+        index_now(record_ids)
+        return
+
+    from hepdata.ext.elasticsearch.tasks import flush_index_queue
+
+    window = current_app.config.get('INDEX_QUEUE_WINDOW', 5)
+    try:
+        client = get_cache_client()
+        pipeline = client.pipeline()
+        pipeline.sadd(_get_queue_key('recids'), *record_ids)
+        pipeline.set(_get_queue_key('oldest'), time.time(), nx=True)
+        pipeline.execute()
+
+        # The flag expires in case the flush task is lost
+        if client.set(_get_queue_key('scheduled'), 1, nx=True, ex=window * 10):
+            flush_index_queue.apply_async(countdown=window)
+    except RedisError as e:
+        log.error('Unable to queue {0} for indexing: {1}'.format(record_ids, e))
+        index_now(record_ids)
+
+
+def flush():
+    """
+    Indexes all the queued records. Records queued while this runs are
+    left for the next flush. The records are queued again if indexing fails,
+    until they have failed INDEX_QUEUE_MAX_ATTEMPTS times.
+
+    :return: [int] number of records indexed
+    """
+    client = get_cache_client()
+    client.delete(_get_queue_key('scheduled'))
+
+    pipeline = client.pipeline()
+    pipeline.smembers(_get_queue_key('recids'))
+    pipeline.get(_get_queue_key('oldest'))
+    pipeline.delete(_get_queue_key('recids'), _get_queue_key('oldest'))
+    recids, oldest, _ = pipeline.execute()
+
+    record_ids = sorted(int(recid) for recid in recids)
+    if not record_ids:
+        return 0
+
+    try:
+        index_now(record_ids)
+    except Exception:
+        _requeue_failed(client, record_ids)
+        raise
+
+    client.hdel(_get_queue_key('attempts'), *record_ids)
+    latency = time.time() - float(oldest) if oldest else 0
+    client.set(_get_queue_key('last_latency'), latency)
+    log.info('Indexed {0} queued records, {1:.1f}s after the first was queued'.format(
+        len(record_ids), latency))
+    return len(record_ids)
+
+
+def _requeue_failed(client, record_ids):
+    """ Queues the records of a failed flush again, except the ones which
+    have failed too often. Those are left in the failed set. """
+    max_attempts = current_app.config.get('INDEX_QUEUE_MAX_ATTEMPTS', 5)
+
+    pipeline = client.pipeline()
+    for recid in record_ids:
+        pipeline.hincrby(_get_queue_key('attempts'), recid, 1)
+    attempts = pipeline.execute()
+
+    retry = [recid for recid, count in zip(record_ids, attempts) if count < max_attempts]
+    failed = [recid for recid, count in zip(record_ids, attempts) if count >= max_attempts]
+
+    if failed:
+        pipeline = client.pipeline()
+        pipeline.sadd(_get_queue_key('failed'), *failed)
+        pipeline.hdel(_get_queue_key('attempts'), *failed)
+        pipeline.execute()
+        log.error('Giving up indexing {0} after {1} attempts'.format(failed, max_attempts))
+
+    if retry:
+        enqueue_record_ids(retry)
+
+
+def get_index_queue_stats():
+    """
+    :return: [dict] depth: number of queued records, oldest_age: seconds
+             since the oldest of them was queued, last_latency: seconds
+             between queueing and indexing during the last flush, failed:
+             number of records given up after INDEX_QUEUE_MAX_ATTEMPTS
+    """
+    client = get_cache_client()
+    pipeline = client.pipeline()
+    pipeline.scard(_get_queue_key('recids'))
+    pipeline.get(_get_queue_key('oldest'))
+    pipeline.get(_get_queue_key('last_latency'))
+    pipeline.scard(_get_queue_key('failed'))
+    depth, oldest, last_latency, failed = pipeline.execute()
+
+    return {
+        'depth': depth,
+        'oldest_age': round(time.time() - float(oldest), 1) if oldest else 0,
+        'last_latency': round(float(last_latency), 1) if last_latency else None,
+        'failed': failed
+    }
@@ -0,0 +1,136 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Sampled timing of the phases of a search.
+
+A timer is kept in flask.g for SEARCH_TIMING_SAMPLE_RATE of the app
+contexts. Phases timed while no timer is active cost a single lookup.
+"""
+
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+# basicConfig leaves the root logger at WARNING. The volume of timing lines
+# is controlled by SEARCH_TIMING_SAMPLE_RATE instead.
+log.setLevel(logging.INFO)
+
+NOT_SAMPLED_YET = object()
+
+
+class SearchTimer(object):
+    """ Wall time and ES 'took' of each phase of the searches of a request. """
+
+    def __init__(self, profile=False):
+        self.profile = profile
+        self.phases = []
+        self.profiles = []
+
+    def add_phase(self, name, wall_ms, took_ms=None):
+        self.phases.append({'name': name, 'wall_ms': round(wall_ms, 2),
+                            'took_ms': took_ms})
+
+    def add_es_result(self, name, es_result):
+        """ Adds the ES took, and the profile if requested, to the last
+        phase with the given name. """
+        for phase in reversed(self.phases):
+            if phase['name'] == name:
+                phase['took_ms'] = es_result.get('took')
+                break
+        if self.profile and 'profile' in es_result:
+            self.profiles.append({'name': name, 'profile': es_result['profile']})
+
+    def total_ms(self):
+        return round(sum(phase['wall_ms'] for phase in self.phases), 2)
+
+    def to_server_timing(self):
+        """ e.g. 'es-search;dur=35.2;desc="took 31ms", merge;dur=0.4' """
+        metrics = []
+        for phase in self.phases:
+            metric = '{0};dur={1}'.format(phase['name'], phase['wall_ms'])
+            if phase['took_ms'] is not None:
+                metric += ';desc="took {0}ms"'.format(phase['took_ms'])
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def to_dict(self):
+        result = {'phases': self.phases, 'total_ms': self.total_ms()}
+        if self.profiles:
+            result['profiles'] = self.profiles
+        return result
+
+
+def get_search_timer():
+    """ Returns the timer of the current app context, starting one for a
+    sample of the contexts. None when timing is off for this context. """
+    if not has_app_context():
+        return None
+
+    timer = getattr(g, 'search_timer', NOT_SAMPLED_YET)
+    if timer is NOT_SAMPLED_YET:
+        sample_rate = current_app.config.get('SEARCH_TIMING_SAMPLE_RATE', 0)
+        if sample_rate and random.random() < sample_rate:
+            g.search_timer = SearchTimer(
+                profile=current_app.config.get('SEARCH_TIMING_PROFILE', False))
+        else:
+            g.search_timer = None
+        timer = g.search_timer
+    return timer
+
+
+def get_active_search_timer():
+    """ Returns the timer of the current app context if a search started
+    one, without sampling contexts that did not search. """
+    if not has_app_context():
+        return None
+
+    timer = getattr(g, 'search_timer', None)
+    return timer if isinstance(timer, SearchTimer) else None
+
+
+@contextmanager
+def timed_phase(name):
+    """ Times the enclosed block as a phase of the current search. """
+    timer = get_search_timer()
+    if timer is None:
+        yield None
+        return
+
+    start = time.time()
+    try:
+        yield timer
+    finally:
+        timer.add_phase(name, (time.time() - start) * 1000)
+
+
+def log_search_timings(query, **details):
+    """ Writes the timings of the current context as a JSON log line. """
+    timer = get_search_timer()
+    if timer is None:
+        return
+
+    entry = {'event': 'search_timing', 'query': query}
+    entry.update(details)
+    entry.update(timer.to_dict())
+    log.info(json.dumps(entry))
@@ -22,40 +22,68 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 
+from collections import defaultdict
+
 from aggregations import parse_aggregations
 from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
 from hepdata.utils.miscellanous import splitter
+from hepdata.ext.elasticsearch.instrumentation import timed_phase
+
 
+def merge_results(pub_result, data_result=None):
+    """ Merge the publication hits with their data table hits.
 
-def merge_results(pub_result, data_result):
+    If no separate data table result is given, the tables are taken from
+    the inner hits returned with each publication.
+    """
     merge_dict = dict()
-    merge_dict['hits'] = pub_result['hits']['hits'] + \
-        data_result['hits']['hits']
+    if data_result is not None:
+        merge_dict['hits'] = pub_result['hits']['hits'] + \
+            data_result['hits']['hits']
+    else:
+        merge_dict['hits'] = pub_result['hits']['hits'] + \
+            get_inner_hits(pub_result['hits']['hits'], CFG_DATA_TYPE)
     merge_dict['total'] = pub_result['hits']['total']
     merge_dict['aggregations'] = pub_result.get('aggregations', {})
     return merge_dict
 
 
-def map_result(es_result):
+def get_inner_hits(hits, inner_hits_name):
+    """ Extract the inner hits with the given name from a list of hits. """
+    inner_hits = []
+    for hit in hits:
+        inner_result = hit.get('inner_hits', {}).get(inner_hits_name)
+        if inner_result:
+            for inner_hit in inner_result['hits']['hits']:
+                inner_hit.setdefault('_type', CFG_DATA_TYPE)
+                inner_hits.append(inner_hit)
+    return inner_hits
+
+
+def map_result(es_result, include=None, exclude=None):
     hits = es_result['hits']
     total_hits = es_result['total']
     aggregations = es_result['aggregations']
 
     # Separate
     tables, papers = splitter(hits, is_datatable)
-    fetch_remaining_papers(tables, papers)
-    aggregated = match_tables_to_papers(tables, papers)
-    results = []
-    for paper, datatables in aggregated:
-        mapped_hit = get_basic_record_information(paper)
-        data = map(get_basic_record_information, datatables)
-        mapped_hit.update({
-            'data': data,
-            'total_tables': len(data),
-        })
-        results.append(mapped_hit)
-
-    facets = parse_aggregations(aggregations)
+    with timed_phase('parents'):
+        fetch_remaining_papers(tables, papers, include=include, exclude=exclude)
+
+    with timed_phase('map'):
+        aggregated = match_tables_to_papers(tables, papers)
+        results = []
+        for paper, datatables in aggregated:
+            mapped_hit = get_basic_record_information(paper)
+            data = map(get_basic_record_information, datatables)
+            mapped_hit.update({
+                'data': data,
+                'total_tables': len(data),
+            })
+            results.append(mapped_hit)
+
+    with timed_phase('aggregations'):
+        facets = parse_aggregations(aggregations)
 
     return {'results': results,
             'facets': facets,
@@ -63,24 +91,26 @@ def map_result(es_result):
 
 
 def match_tables_to_papers(tables, papers):
+    """ Group the tables by their related publication in a single pass,
+    keeping the tables of each paper sorted by the number in their title. """
+    tables_by_paper = defaultdict(list)
+    for table in sorted(tables, key=table_sort_key):
+        tables_by_paper[table['_source']['related_publication']].append(table)
+
     aggregated = []
     for paper in papers:
         paper_id = int(paper['_id'])
-        relevant_tables = [t for t in tables
-                           if t['_source']['related_publication'] == paper_id]
+        aggregated.append((paper, tables_by_paper.get(paper_id, [])))
 
-        # Create a function to extract numbers from titles and sort with it
-        def sort_key(elem):
-            """ Extract the numbers from the title. """
-            title = elem['_source']['title']
-            numbers = [int(x) for x in title.split() if x.isdigit()]
-            return numbers[0] if numbers else title
-
-        relevant_tables.sort(key=sort_key)
+    return aggregated
 
-        aggregated.append((paper, relevant_tables))
 
-    return aggregated
+def table_sort_key(table):
+    """ Extract the first number from the table title to sort with it.
+    Tables with a number in their title come before the ones without. """
+    title = table['_source']['title']
+    numbers = [int(x) for x in title.split() if x.isdigit()]
+    return (0, numbers[0]) if numbers else (1, title)
 
 
 def get_basic_record_information(record):
@@ -106,16 +136,27 @@ def get_basic_record_information(record):
     return res
 
 
-def fetch_remaining_papers(tables, papers):
-    from hepdata.ext.elasticsearch.api import fetch_record
-    hit_papers = map(lambda x: int(x['_id']), papers)
+def fetch_remaining_papers(tables, papers, include=None, exclude=None):
+    """ Add the publications of the given tables which are not already
+    among the papers, fetching all of them with a single multi-get. """
+    from hepdata.ext.elasticsearch.api import fetch_records
+    hit_papers = set(map(lambda x: int(x['_id']), papers))
+
+    missing_papers = []
     for table in tables:
         paper_id = table['_source'].get('related_publication')
         if paper_id and paper_id not in hit_papers:
-            paper_source = fetch_record(paper_id, CFG_PUB_TYPE)
-            paper = {'_id': str(paper_id), '_source': paper_source}
-            papers.append(paper)
-            hit_papers.append(paper_id)
+            missing_papers.append(paper_id)
+            hit_papers.add(paper_id)
+
+    if missing_papers:
+        paper_sources = fetch_records(missing_papers, CFG_PUB_TYPE,
+                                      include=include, exclude=exclude)
+        for paper_id in missing_papers:
+            paper_source = paper_sources.get(paper_id)
+            if paper_source is not None:
+                paper = {'_id': str(paper_id), '_source': paper_source}
+                papers.append(paper)
 
 
 def is_datatable(es_hit):
@@ -21,10 +21,13 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 import re
+from collections import OrderedDict
+from threading import Lock
 
 
 class QueryBuilder(object):
     def __init__(self, query=None):
+        self.date_filter = None
         if query:
             self.query = query
         else:
@@ -112,6 +115,52 @@ class QueryBuilder(object):
         else:
             self.query.update({"query": query_dict})
 
+    def add_child_inner_hits(self, related_type, related_query=None, size=3,
+                             name=None):
+        """ Return the best matching children of every hit alongside it.
+
+        The has_child clause carrying the inner_hits is optional and has no
+        boost, so it does not change which parents match or how they score.
+        Only the children matching ``related_query`` are returned (up to
+        ``size``), or every child if there is no query.
+        """
+        related_query = {"match_all": {}} if not related_query else related_query
+        name = related_type if not name else name
+
+        inner_hits_dict = {
+            "has_child": {
+                "type": related_type,
+                "score_mode": "none",
+                "boost": 0,
+                "query": {
+                    "bool": {
+                        "must": [related_query]
+                    }
+                },
+                "inner_hits": {
+                    "name": name,
+                    "size": size
+                }
+            }
+        }
+
+        if "filtered" in self.query.get("query", {}):
+            current_query = self.query["query"]["filtered"]["query"]
+        else:
+            current_query = self.query.get("query", {"match_all": {}})
+
+        query_dict = {
+            "bool": {
+                "must": [current_query],
+                "should": [inner_hits_dict]
+            }
+        }
+
+        if "filtered" in self.query.get("query", {}):
+            self.query["query"]["filtered"]["query"] = query_dict
+        else:
+            self.query.update({"query": query_dict})
+
     def add_query_string(self, query_string=''):
         query_dict = self.generate_query_string(query_string=query_string)
 
@@ -125,6 +174,16 @@ class QueryBuilder(object):
         if not aggs:
             aggs = default_aggregations()
 
+        if self.date_filter is not None:
+            # Only the date histogram ignores the date filter
+            aggs = {
+                name: agg if name == "dates" else {
+                    "filter": self.date_filter,
+                    "aggs": {name: agg}
+                }
+                for name, agg in aggs.items()
+            }
+
         self.query.update({"aggs": aggs})
 
     def add_highlighting(self, fields):
@@ -137,47 +196,174 @@ class QueryBuilder(object):
         })
 
     def add_filters(self, filters):
+        """ Add the filters to the query. The date filter is applied as a
+        post filter, so that the date histogram shows all the years
+        matching the rest of the query. """
         from config.es_config import get_filter_clause
         filter_clauses = []
         for name, value in filters:
             clause = get_filter_clause(name, value)
-            filter_clauses.append(clause)
+            if name == 'date':
+                self.date_filter = clause
+                self.add_post_filter(clause)
+            else:
+                filter_clauses.append(clause)
 
         if filter_clauses and "filtered" in self.query.get("query", {}):
             self.query["query"]["filtered"]["filter"] = {"and": filter_clauses}
 
     def add_post_filter(self, postfilter):
         if postfilter is not None:
+            if "post_filter" in self.query:
+                postfilter = {"and": [self.query["post_filter"], postfilter]}
             self.query["post_filter"] = postfilter
 
 
+class QueryClause(object):
+    """ A single clause of a HEPData query, e.g. 'observables:ASYM'
+    or free text such as 'higgs boson'. """
+
+    def __init__(self, value, field=None, quoted=False, single_token=True):
+        self.value = value
+        self.field = field
+        self.quoted = quoted
+        # in 'observables:SIG higgs' the field only applies to 'SIG'
+        self.single_token = single_token
+
+    def to_query_string(self):
+        value = '"{0}"'.format(self.value) if self.quoted else self.value
+        if self.field:
+            return "{0}:{1}".format(self.field, value)
+        return value
+
+    def to_es_query(self):
+        if self.quoted:
+            return {"match_phrase": {self.field: self.value}}
+        return {"match": {self.field: {"query": self.value, "operator": "and"}}}
+
+
+class ParsedQuery(object):
+    """ A HEPData query as a list of clauses joined by boolean operators.
+    operators[i] joins clauses[i] and clauses[i + 1]. """
+
+    def __init__(self, clauses, operators):
+        self.clauses = tuple(clauses)
+        self.operators = tuple(operators)
+
+    def to_query_string(self):
+        parts = []
+        for index, clause in enumerate(self.clauses):
+            if index > 0:
+                parts.append(self.operators[index - 1])
+            parts.append(clause.to_query_string())
+        return " ".join(parts)
+
+    def is_structured(self):
+        """ True if the query only contains single field:value or
+        field:"phrase" clauses on known fields, joined by the same operator,
+        so it can be run as a bool query. """
+        return len(self.clauses) > 0 \
+            and all(clause.field in HEPDataQueryParser.FIELD_MAPPING.values()
+                    and clause.single_token for clause in self.clauses) \
+            and len(set(self.operators)) <= 1
+
+    def to_es_query(self, fields=None):
+        """ Build a bool query of match clauses if the query is structured,
+        otherwise a query_string query. """
+        if not self.clauses:
+            return QueryBuilder.generate_query_string()
+
+        if not self.is_structured():
+            return QueryBuilder.generate_query_string(self.to_query_string(), fields)
+
+        clauses = [clause.to_es_query() for clause in self.clauses]
+        if self.operators and self.operators[0] == "OR":
+            return {"bool": {"should": clauses, "minimum_should_match": 1}}
+        return {"bool": {"must": clauses}}
+
+
 class HEPDataQueryParser(object):
+    # query should be something like 'observables:ASYM' which
+    # would translate to data_keywords.observables:ASYM
+    FIELD_MAPPING = {
+        "observables": "data_keywords.observables",
+        "cmenergies": "data_keywords.cmenergies",
+        "phrases": "data_keywords.phrases",
+        "reactions": "data_keywords.reactions"
+    }
+
+    OPERATORS = ("AND", "OR")
+
+    TOKEN_PATTERN = re.compile(r'(?:[^\s":]+:)?"[^"]*"|\S+')
+
+    CACHE_SIZE = 512
+
+    _cache = OrderedDict()
+    _cache_lock = Lock()
+
     @staticmethod
     def parse_query(query_string):
-        # query should be something like 'observable:ASYM' which
-        # would translate to data_keywords.observables:ASYM
-        mapping = {
-            "keys": {
-                "observables": "data_keywords.observables:{0}",
-                "cmenergies": "data_keywords.cmenergies:{0}",
-                "phrases": "data_keywords.phrases:{0}",
-                "reactions": "data_keywords.reactions:{0}"
-            }
-        }
+        """ Translate the HEPData field prefixes of a query string into
+        the names of the indexed fields. """
+        return HEPDataQueryParser.parse(query_string).to_query_string()
+
+    @classmethod
+    def parse(cls, query_string):
+        """ Parse a query string into a ParsedQuery.
+        The most recently parsed queries are cached. """
+        query_string = query_string.strip()
+
+        with cls._cache_lock:
+            parsed_query = cls._cache.pop(query_string, None)
+            if parsed_query is None:
+                parsed_query = cls._parse(query_string)
+                if len(cls._cache) >= cls.CACHE_SIZE:
+                    cls._cache.popitem(last=False)
+            cls._cache[query_string] = parsed_query
+
+        return parsed_query
+
+    @classmethod
+    def _parse(cls, query_string):
+        clauses = []
+        operators = []
+        current = []
+
+        def close_clause():
+            if current:
+                clauses.append(cls._parse_clause(current))
+                del current[:]
+
+        for token in cls.TOKEN_PATTERN.findall(query_string):
+            if token in cls.OPERATORS:
+                if current:
+                    close_clause()
+                    operators.append(token)
+            else:
+                current.append(token)
+
+        close_clause()
+
+        # drop an operator left dangling at the end of the query
+        return ParsedQuery(clauses, operators[:max(len(clauses) - 1, 0)])
+
+    @classmethod
+    def _parse_clause(cls, tokens):
+        text = " ".join(tokens)
+        field = None
 
-        new_query_string = query_string
+        if ':' in tokens[0]:
+            key, value = text.split(':', 1)
+            if key in cls.FIELD_MAPPING:
+                field = cls.FIELD_MAPPING[key]
+                text = value
 
-        for query_part in re.split("AND|OR", query_string):
-            query_part = query_part.strip()
-            if ':' in query_part:
-                try:
-                    _key_value = query_part.split(':')
-                    _key = mapping['keys'][_key_value[0]].format(_key_value[1])
-                    new_query_string = new_query_string.replace(query_part, "{0}".format(_key))
-                except KeyError:
-                    continue
+        quoted = len(text) > 1 and text.startswith('"') and text.endswith('"') \
+            and text.count('"') == 2
+        if quoted:
+            text = text[1:-1]
 
-        return new_query_string
+        return QueryClause(text, field=field, quoted=quoted, single_token=len(tokens) == 1)
 
 
 def get_query_by_type(es_type, query_string=''):
@@ -185,11 +371,12 @@ def get_query_by_type(es_type, query_string=''):
     (i.e. appropriate fields and boosting) """
     from config.es_config import default_queryable_fields
     fields = default_queryable_fields(es_type)
-    return QueryBuilder.generate_query_string(query_string, fields)
+    return HEPDataQueryParser.parse(query_string).to_es_query(fields)
 
 
 def get_authors_query(query_string=''):
     """ Generate the nested query for authors (special case). """
-    return QueryBuilder.generate_nested_query('authors',
-                                              query_string,
-                                              ['first_name', 'last_name'])
+    return QueryBuilder.generate_nested_query(
+        'authors',
+        HEPDataQueryParser.parse_query(query_string),
+        ['first_name', 'last_name'])
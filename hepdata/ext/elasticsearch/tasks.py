@@ -0,0 +1,54 @@
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+from celery import shared_task
+
+from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
+from hepdata.ext.elasticsearch.api import rebuild_index
+from hepdata.ext.elasticsearch.incremental import reindex_since
+from hepdata.ext.elasticsearch.index_queue import flush
+
+
+@shared_task()
+def reindex_changed_records(since=None):
+    """
+    Reindexes the records changed since the last run.
+    :param since: optional start date, e.g. '2016-07-05T10:00'
+    :return: number of records reindexed
+    """
+    return reindex_since(since=since)
+
+
+@shared_task()
+def rebuild_indices():
+    """
+    Rebuilds the record index behind its alias, then the submission index.
+    :return: name of the new record index
+    """
+    new_index = rebuild_index()
+    AdminIndexer().reindex(recreate=True)
+    return new_index
+
+
+@shared_task()
+def flush_index_queue():
+    """
+    Indexes the records queued by enqueue_record_ids.
+    :return: number of records indexed
+    """
+    return flush()
@@ -20,7 +20,9 @@
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
-from collections import defaultdict
+import hashlib
+import json
+from collections import defaultdict, OrderedDict
 
 from flask import current_app
 
@@ -53,7 +55,7 @@ def prepare_author_for_indexing(document):
 
     if authors is not None:
         for author in authors:
-            data_dict = author
+            data_dict = get_author_document(author)
 
             op_dict = {
                 "index": {
@@ -68,6 +70,38 @@ def prepare_author_for_indexing(document):
     return author_data
 
 
+def get_author_document(author):
+    """ Returns the document indexed for an author, with a hash of its
+    content to detect authors which have not changed since last indexed. """
+    data_dict = dict(author)
+    data_dict['full_name_suggest'] = get_author_suggest_inputs(author)
+    data_dict['content_hash'] = hashlib.sha1(
+        json.dumps(data_dict, sort_keys=True, default=str)).hexdigest()
+    return data_dict
+
+
+def get_author_documents(documents):
+    """ Returns the distinct author documents of the given publications,
+    keyed by full name. The first occurrence of each author is kept. """
+    authors = OrderedDict()
+    for document in documents:
+        for author in document.get('authors') or []:
+            if author.get('full_name') and author['full_name'] not in authors:
+                authors[author['full_name']] = get_author_document(author)
+    return authors
+
+
+def get_author_suggest_inputs(author):
+    """ Returns the completion suggester entry for an author, so the author
+    can be found by typing the start of the full, first or last name. """
+    inputs = [author['full_name']]
+    for field in ['first_name', 'last_name']:
+        if author.get(field) and author[field] not in inputs:
+            inputs.append(author[field])
+
+    return {"input": inputs, "output": author['full_name']}
+
+
 def calculate_sort_order(is_reversed, sorting_field):
     """ Take the default sort order for a given field and an information
      whether to flip it and compute the final sorting order. """
@@ -99,14 +133,19 @@ def push_keywords(docs):
 
         keywords = reduce(lambda acc, d: acc + d['keywords'], data, [])
 
-        agg_keywords = defaultdict(list)
-        for kw in keywords:
-            agg_keywords[kw['name']].append(kw['value'])
+        pub['data_keywords'] = aggregate_keywords(keywords)
 
-        # Remove duplicates
-        for k, v in agg_keywords.items():
-            agg_keywords[k] = list(set(v))
+    return publications + datatables
 
-        pub['data_keywords'] = agg_keywords
 
-    return publications + datatables
+def aggregate_keywords(keywords):
+    """
+        Group keywords by name, without duplicate values, e.g.
+        {'cmenergies': ['7000.0'], 'observables': ['SIG', 'DSIG/DPT']}
+    """
+    agg_keywords = defaultdict(list)
+    for kw in keywords:
+        if kw['value'] not in agg_keywords[kw['name']]:
+            agg_keywords[kw['name']].append(kw['value'])
+
+    return dict(agg_keywords)
@@ -29,7 +29,7 @@ from invenio_accounts.models import User
 from sqlalchemy import and_, or_
 
 from hepdata.modules.permissions.models import SubmissionParticipant
-from hepdata.modules.records.utils.common import get_record_by_id, decode_string
+from hepdata.modules.records.utils.common import get_record_by_id, get_records_by_ids, decode_string
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.records.utils.users import has_role
 from hepdata.modules.submission.models import HEPSubmission, DataReview
@@ -227,8 +227,14 @@ def get_pending_invitations_for_user(user):
 
     result = []
 
+    publication_records = dict(
+        (record['recid'], record) for record in
+        get_records_by_ids([invite.publication_recid for invite in pending_invites]))
+
     for invite in pending_invites:
-        publication_record = get_record_by_id(invite.publication_recid)
+        publication_record = publication_records.get(invite.publication_recid)
+        if publication_record is None:
+            continue
         hepsubmission = get_latest_hepsubmission(publication_recid=invite.publication_recid)
 
         coordinator = get_user_from_id(hepsubmission.coordinator)
@@ -23,12 +23,13 @@
 
 from __future__ import absolute_import, print_function
 
+from datetime import date, timedelta
+
 from flask import Blueprint, jsonify, request, render_template
 from flask.ext.login import login_required, current_user
 
-from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
-from hepdata.ext.elasticsearch.api import reindex_all
-from hepdata.ext.elasticsearch.api import push_data_keywords
+from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer, MAX_SUMMARY_SIZE, DEFAULT_SUMMARY_SIZE
+from hepdata.ext.elasticsearch.tasks import rebuild_indices
 from hepdata.modules.dashboard.api import prepare_submissions, get_pending_invitations_for_user
 from hepdata.modules.permissions.api import get_pending_request, get_pending_coordinator_requests
 from hepdata.modules.permissions.views import check_is_sandbox_record
@@ -132,10 +133,7 @@ def delete_submission(recid):
 @login_required
 def reindex():
     if has_role(current_user, 'admin'):
-        reindex_all(recreate=True)
-        push_data_keywords()
-        admin_idx = AdminIndexer()
-        admin_idx.reindex(recreate=True)
+        rebuild_indices.delay()
         return jsonify({"success": True})
     else:
         return jsonify({"success": False,
@@ -159,7 +157,8 @@ def submissions():
     user_profile = current_userprofile.query.filter_by(user_id=current_user.get_id()).first()
 
     ctx = {'user_is_admin': has_role(current_user, 'admin'),
-           'user_profile': user_profile}
+           'user_profile': user_profile,
+           'summary_size': MAX_SUMMARY_SIZE}
 
     return render_template('hepdata_dashboard/submissions.html', ctx=ctx)
 
@@ -167,6 +166,26 @@ def submissions():
 @blueprint.route('/submissions/list', methods=['GET'])
 @login_required
 def submissions_list():
+    """
+    Lists the submissions by date of last update. Optional parameters:
+    days (only the submissions updated in the last n days), or from_date
+    and to_date (YYYY-MM-DD), and page and size for pagination. Pages hold
+    DEFAULT_SUMMARY_SIZE submissions unless a size of up to MAX_SUMMARY_SIZE
+    is given.
+    """
+    from_date = request.args.get('from_date')
+    days = request.args.get('days', type=int)
+    if days:
+        from_date = (date.today() - timedelta(days=days)).isoformat()
+
+    size = min(max(1, request.args.get('size', DEFAULT_SUMMARY_SIZE, type=int)), MAX_SUMMARY_SIZE)
+    page = max(1, request.args.get('page', 1, type=int))
+    offset = (page - 1) * size
+    if offset >= MAX_SUMMARY_SIZE:
+        return jsonify({"success": False,
+                        "message": "Only the first {0} submissions can be listed.".format(MAX_SUMMARY_SIZE)}), 400
+
     admin_idx = AdminIndexer()
-    summary = admin_idx.get_summary()
+    summary = admin_idx.get_summary(from_date=from_date, to_date=request.args.get('to_date'),
+                                    offset=offset, size=size)
     return jsonify(summary)
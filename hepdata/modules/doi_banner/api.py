@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""DOI to record lookups for the DOI banner, cached in memory and REDIS."""
+
+import logging
+import time
+
+from flask import current_app
+from redis.exceptions import RedisError
+
+from hepdata.ext.elasticsearch.api import get_record_matching_field, get_records_with_field
+from hepdata.utils.cache import get_cache_client, get_cache_key
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+# REDIS stores an empty string for DOIs known not to be in HEPData.
+MISSING = ''
+
+LOCAL_CACHE_SIZE = 10000
+
+_local_cache = {}
+
+_REFERENCE_SOURCE = ['doi', 'recid', 'inspire_id', 'related_publication']
+
+
+def _get_doi_key(doi):
+    return get_cache_key('doi', 'record', doi)
+
+
+def get_record_reference(recid, inspire_id=None):
+    """
+    :return: the part of the record URL after /record/, which is the
+             INSPIRE id of the publication if it has one and its recid if not
+    """
+    if inspire_id:
+        return 'ins{0}'.format(inspire_id)
+    if recid:
+        return str(recid)
+    return None
+
+
+def _cache_locally(doi, reference):
+    if len(_local_cache) >= LOCAL_CACHE_SIZE:
+        _local_cache.clear()
+    _local_cache[doi] = (reference, time.time() + current_app.config.get('DOI_BANNER_LOCAL_TTL', 60))
+
+
+def clear_local_cache():
+    _local_cache.clear()
+
+
+def is_doi_map_loaded():
+    """ True while the map put in REDIS by load_doi_map is current. Until the
+    flag expires, a DOI absent from REDIS is not in HEPData and ES is not
+    queried. """
+    try:
+        return bool(get_cache_client().get(get_cache_key('doi', 'record', 'loaded')))
+    except RedisError as e:
+        log.error('Unable to read the DOI map: {0}'.format(e))
+        return False
+
+
+def add_doi_to_banner_map(doi, recid, inspire_id=None):
+    """
+    Adds or refreshes a DOI in the shared map, replacing any cached miss.
+    :param doi: publication, submission or table DOI
+    :param recid: recid of the publication the DOI resolves to
+    :param inspire_id: INSPIRE id of the publication, if it has one
+    """
+    reference = get_record_reference(recid, inspire_id)
+    if not doi or not reference:
+        return
+
+    _cache_locally(doi, reference)
+    try:
+        get_cache_client().set(_get_doi_key(doi), reference)
+    except RedisError as e:
+        log.error('Unable to add {0} to the DOI map: {1}'.format(doi, e))
+
+
+def add_dois_to_banner_map(dois, recid, inspire_id=None):
+    for doi in dois:
+        add_doi_to_banner_map(doi, recid, inspire_id)
+
+
+def remove_dois_from_banner_map(dois):
+    """
+    Removes the DOIs of a deleted record from the shared map. Other processes
+    forget them once their local entries expire.
+    :param dois: publication, submission and table DOIs
+    """
+    dois = [doi for doi in dois if doi]
+    for doi in dois:
+        _local_cache.pop(doi, None)
+
+    if not dois:
+        return
+    try:
+        get_cache_client().delete(*[_get_doi_key(doi) for doi in dois])
+    except RedisError as e:
+        log.error('Unable to remove {0} from the DOI map: {1}'.format(dois, e))
+
+
+def load_doi_map():
+    """
+    Puts every DOI in the index in the shared map.
+    :return: number of DOIs loaded
+    """
+    client = get_cache_client()
+    pipeline = client.pipeline(transaction=False)
+    count = 0
+    for hit in get_records_with_field('doi', source=_REFERENCE_SOURCE):
+        source = hit.get('_source', {})
+        reference = _get_source_reference(source)
+        if source.get('doi') and reference:
+            pipeline.set(_get_doi_key(source['doi']), reference)
+            count += 1
+            if count % 1000 == 0:
+                pipeline.execute()
+    pipeline.setex(get_cache_key('doi', 'record', 'loaded'), current_app.config.get('DOI_BANNER_MAP_TTL', 86400), 1)
+    pipeline.execute()
+    return count
+
+
+def _get_source_reference(source):
+    # Tables point to their publication, publications to themselves
+    recid = source.get('related_publication') or source.get('recid')
+    return get_record_reference(recid, source.get('inspire_id'))
+
+
+def _lookup_in_index(doi):
+    record = get_record_matching_field('doi', doi, source=_REFERENCE_SOURCE)
+    if record is not None:
+        return _get_source_reference(record)
+    return None
+
+
+def get_record_for_doi(doi):
+    """
+    Resolves a DOI to its HEPData record. Lookups are answered from process
+    memory, then REDIS. ES is only asked about DOIs never seen before the map
+    has been loaded, and misses are cached too.
+
+    :param doi:
+    :return: the record reference, 'ins' followed by the INSPIRE id or the
+             recid of records without one, or None if the DOI is not in HEPData
+    """
+    cached = _local_cache.get(doi)
+    if cached is not None and cached[1] > time.time():
+        return cached[0] or None
+
+    try:
+        client = get_cache_client()
+        reference = client.get(_get_doi_key(doi))
+        if reference is None and not is_doi_map_loaded():
+            reference = _lookup_in_index(doi)
+            if reference:
+                client.set(_get_doi_key(doi), reference)
+            else:
+                client.setex(_get_doi_key(doi),
+                             current_app.config.get('DOI_BANNER_NEGATIVE_TTL', 3600), MISSING)
+    except RedisError as e:
+        log.error('Unable to read the DOI map: {0}'.format(e))
+        reference = _lookup_in_index(doi)
+
+    if isinstance(reference, bytes):
+        reference = reference.decode('utf-8')
+
+    _cache_locally(doi, reference or MISSING)
+    return reference or None
@@ -1,5 +1,5 @@
 from flask import Blueprint, redirect, abort, send_file, url_for
-from hepdata.ext.elasticsearch.api import get_records_matching_field
+from hepdata.modules.doi_banner.api import get_record_for_doi
 import logging
 import os
 
@@ -19,10 +19,9 @@ def resolve_doi_data(doi):
     :param doi:
     :return:
     """
-    matching = get_records_matching_field('doi', doi, source={"includes": ['inspire_id']})
-    if matching.get('hits').get('total') > 0:
-        _returned = matching.get('hits').get('hits')[0].get('_source').get('inspire_id')
-        return redirect('/record/ins{0}'.format(_returned))
+    reference = get_record_for_doi(doi)
+    if reference:
+        return redirect('/record/{0}'.format(reference))
     return abort(404)
 
 
@@ -34,9 +33,7 @@ def get_doi_banner(doi):
     :return:
     """
 
-    matching = get_records_matching_field('doi', doi, source={"includes": ['inspire_id']})
-    if matching.get('hits').get('total') > 0:
-        print(matching)
+    if get_record_for_doi(doi):
         return send_file(os.path.join(base_dir, 'static/img/hepdata-doi-banner.png'))
     else:
         return send_file(os.path.join(base_dir, 'static/img/1px.png'))
@@ -30,23 +30,23 @@ from functools import wraps
 import time
 from flask import redirect, request, render_template, jsonify, current_app, Response, abort
 from flask.ext.login import current_user
-from invenio_accounts.models import User
-from sqlalchemy.orm.exc import NoResultFound
+from invenio_db import db
+from sqlalchemy import func
 from werkzeug.utils import secure_filename
 
 from hepdata.modules.converter import convert_oldhepdata_to_yaml
-from hepdata.modules.permissions.api import user_allowed_to_perform_action
 from hepdata.modules.permissions.models import SubmissionParticipant
 from hepdata.modules.records.subscribers.api import is_current_user_subscribed_to_record
 from hepdata.modules.records.utils.common import decode_string, find_file_in_directory, allowed_file, \
-    remove_file_extension, truncate_string, get_record_contents
+    remove_file_extension, truncate_string, get_record_contents, extract_journal_info
 from hepdata.modules.records.utils.data_processing_utils import process_ctx
-from hepdata.modules.records.utils.submission import process_submission_directory, create_data_review
+from hepdata.modules.records.utils.submission import process_submission_directory
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_action_for_submission_participant
 from hepdata.modules.records.utils.yaml_utils import split_files
-from hepdata.modules.stats.views import increment, get_count
+from hepdata.modules.stats.models import DailyAccessStatistic
+from hepdata.modules.stats.views import increment
 from hepdata.modules.submission.models import RecordVersionCommitMessage, DataSubmission, HEPSubmission, DataReview
 from hepdata.utils.file_extractor import extract
 from hepdata.utils.users import get_user_from_id
@@ -69,7 +69,7 @@ def returns_json(f):
 
 
 def format_submission(recid, record, version, version_count, hepdata_submission,
-                      data_table=None):
+                      data_table=None, view=None):
     """
     Performs all the processing of the record to be display
     :param recid:
@@ -77,8 +77,12 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
     :param version:
     :param hepdata_submission:
     :param data_table:
+    :param view: the result of load_record_view, loaded if not given
     :return:
     """
+    if view is None:
+        view = load_record_view(recid)
+
     ctx = {}
     if hepdata_submission is not None:
 
@@ -104,16 +108,15 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
             if authors:
                 truncate_author_list(record)
 
-            determine_user_privileges(recid, ctx)
+            determine_user_privileges(recid, ctx, view)
 
         else:
             ctx['record'] = {}
-            determine_user_privileges(recid, ctx)
+            determine_user_privileges(recid, ctx, view)
             ctx['show_upload_widget'] = True
             ctx['show_review_widget'] = False
 
-        ctx['reviewer_count'] = SubmissionParticipant.query.filter_by(
-            publication_recid=recid, status="primary", role="reviewer").count()
+        ctx['reviewer_count'] = view['reviewer_count']
         ctx['reviewers_notified'] = hepdata_submission.reviewers_notified
 
         ctx['record']['last_updated'] = hepdata_submission.last_updated
@@ -145,10 +148,10 @@ def format_submission(recid, record, version, version_count, hepdata_submission,
 
         format_tables(ctx, data_record_query, data_table, recid)
 
-        ctx['access_count'] = get_count(recid)
+        ctx['access_count'] = view['access_count']
         ctx['mode'] = 'record'
         ctx['coordinator'] = hepdata_submission.coordinator
-        ctx['coordinators'] = get_coordinators_in_system()
+        ctx['coordinators'] = view['coordinators']
         ctx['record'].pop('authors', None)
 
     return ctx
@@ -178,18 +181,13 @@ def get_commit_message(ctx, recid):
     :param ctx:
     :param recid:
     """
-    try:
-        commit_message_query = RecordVersionCommitMessage.query \
-            .filter_by(version=ctx["version"], recid=recid)
-
-        if commit_message_query.count() > 0:
-            commit_message = commit_message_query.one()
-            ctx["revision_message"] = {
-                'version': commit_message.version,
-                'message': commit_message.message}
+    commit_message = RecordVersionCommitMessage.query \
+        .filter_by(version=ctx["version"], recid=recid).first()
 
-    except NoResultFound:
-        pass
+    if commit_message is not None:
+        ctx["revision_message"] = {
+            'version': commit_message.version,
+            'message': commit_message.message}
 
 
 def create_breadcrumb_text(authors, ctx, record):
@@ -212,33 +210,78 @@ def submission_has_resources(hepsubmission):
     return len(hepsubmission.resources) > 0
 
 
-def extract_journal_info(record):
-    if record and 'type' in record:
-        if 'thesis' in record['type']:
-            if 'type' in record['dissertation']:
-                record['journal_info'] = record['dissertation']['type'] + ", " + record['dissertation'][
-                    'institution']
-            else:
-                record['journal_info'] = "PhD Thesis"
-        elif 'conferencepaper' in record['type']:
-            record['journal_info'] = "Conference Paper"
+def load_record_view(recid):
+    """
+    Loads what rendering a record needs to know about its versions and about
+    the current user, with one query each, instead of counting them again
+    for every check.
+
+    :param recid: publication record id
+    :return: dict with the submissions of the record ordered by version,
+             the access count, the reviewer count, whether the current user
+             is an admin or the coordinator, their participant roles, whether
+             they are allowed to see unfinished versions and, for admins, the
+             coordinators they can hand the record to
+    """
+    # the access count is summed in the same query as the submissions
+    access_count = db.session.query(func.sum(DailyAccessStatistic.count)).filter(
+        DailyAccessStatistic.publication_recid == recid).as_scalar()
+    rows = db.session.query(HEPSubmission, access_count).filter(
+        HEPSubmission.publication_recid == recid).order_by(HEPSubmission.version).all()
+    submissions = [submission for submission, _ in rows]
+
+    participants = SubmissionParticipant.query.filter_by(publication_recid=recid).all()
+
+    view = {
+        'submissions': submissions,
+        'access_count': {'sum': int(rows[0][1]) if rows and rows[0][1] else 1},
+        'reviewer_count': len([participant for participant in participants
+                               if participant.status == 'primary' and participant.role == 'reviewer']),
+        'participant_roles': set(),
+        'is_admin': False,
+        'is_coordinator': False,
+        'coordinators': []
+    }
+
+    if current_user.is_authenticated:
+        user_id = int(current_user.get_id())
+        view['participant_roles'] = set(participant.role for participant in participants
+                                        if participant.user_account == user_id)
+        view['is_admin'] = has_role(current_user, 'admin')
+        view['is_coordinator'] = any(submission.coordinator == user_id for submission in submissions)
+
+        # only admins are shown the coordinators
+        if view['is_admin']:
+            view['coordinators'] = get_coordinators_in_system()
+
+    view['allowed'] = view['is_admin'] or view['is_coordinator'] or len(view['participant_roles']) > 0
+    return view
+
+
+def get_version_from_view(view, version):
+    """ :return: the HEPSubmission of the given version, or None """
+    for submission in reversed(view['submissions']):
+        if submission.version == version:
+            return submission
+    return None
 
 
 def render_record(recid, record, version, output_format, light_mode=False):
-    if user_allowed_to_perform_action(recid):
-        version_count = HEPSubmission.query.filter_by(
-            publication_recid=recid).count()
+    view = load_record_view(recid)
+
+    if view['allowed']:
+        version_count = len(view['submissions'])
     else:
-        version_count = HEPSubmission.query.filter_by(
-            publication_recid=recid, overall_status='finished').count()
+        version_count = len([submission for submission in view['submissions']
+                             if submission.overall_status == 'finished'])
 
     if version == -1:
         version = version_count
 
-    hepdata_submission = get_latest_hepsubmission(publication_recid=recid, version=version)
+    hepdata_submission = get_version_from_view(view, version)
 
     if hepdata_submission is not None:
-        ctx = format_submission(recid, record, version, version_count, hepdata_submission)
+        ctx = format_submission(recid, record, version, version_count, hepdata_submission, view=view)
         increment(recid)
 
         if output_format == 'html':
@@ -414,15 +457,14 @@ def assign_or_create_review_status(data_table_metadata, publication_recid,
     :param data_table_metadata: the metadata describing the main table.
     :param publication_recid: publication record id
     """
-    data_review_query = DataReview.query.filter_by(
-        publication_recid=publication_recid, version=version)
+    data_review_records = DataReview.query.filter_by(
+        publication_recid=publication_recid, version=version).options(
+        db.subqueryload(DataReview.messages)).all()
     # this method should also create all the DataReviews for data_tables that
     # are not currently present to avoid
     # only creating data reviews when the review is clicked explicitly.
     assigned_tables = []
-    if data_review_query.count() > 0:
-        data_review_records = data_review_query.all()
-
+    if data_review_records:
         for data_review in data_review_records:
             if data_review.data_recid in data_table_metadata:
                 data_table_metadata[data_review.data_recid][
@@ -433,52 +475,32 @@ def assign_or_create_review_status(data_table_metadata, publication_recid,
                     data_review.messages) > 0
                 assigned_tables.append(data_review.data_recid)
 
-    # now create the missing data reviews
-    for data_table_id in data_table_metadata:
-        if data_table_id not in assigned_tables:
-            data_record = create_data_review(
-                data_table_id, publication_recid, version=version)
-            data_table_metadata[data_table_id][
-                "review_flag"] = data_record.status
-            data_table_metadata[data_table_id]["review_status"] = \
-                RECORD_PLAIN_TEXT[data_record.status]
+    # now create the missing data reviews, the tables were just loaded so
+    # they all exist
+    missing_reviews = [DataReview(publication_recid=publication_recid, data_recid=data_table_id,
+                                  version=version, status='todo')
+                       for data_table_id in data_table_metadata if data_table_id not in assigned_tables]
+    if missing_reviews:
+        db.session.add_all(missing_reviews)
+        db.session.commit()
 
+    for data_record in missing_reviews:
+        data_table_metadata[data_record.data_recid][
+            "review_flag"] = data_record.status
+        data_table_metadata[data_record.data_recid]["review_status"] = \
+            RECORD_PLAIN_TEXT[data_record.status]
 
-def determine_user_privileges(recid, ctx):
-    # show_review_area = not show_upload_area
-    ctx['show_review_widget'] = False
-    ctx['show_upload_widget'] = False
-    ctx['is_submission_coordinator_or_admin'] = False
-    ctx['is_admin'] = False
 
-    if current_user.is_authenticated:
-        user_id = current_user.get_id()
-        participant_records = SubmissionParticipant.query.filter_by(
-            user_account=user_id, publication_recid=recid).all()
-
-        for participant_record in participant_records:
-            if participant_record is not None:
-                if participant_record.role == 'reviewer':
-                    ctx['show_review_widget'] = True
-
-                if participant_record.role == 'uploader':
-                    ctx['show_upload_widget'] = True
-
-        user = User.query.get(current_user.get_id())
-        if has_role(user, 'admin'):
-            ctx['is_submission_coordinator_or_admin'] = True
-            ctx['is_admin'] = True
-        else:
-            matching_records = HEPSubmission.query.filter_by(
-                publication_recid=recid,
-                coordinator=current_user.get_id()).count()
-
-            if matching_records > 0:
-                ctx['is_submission_coordinator_or_admin'] = True
+def determine_user_privileges(recid, ctx, view=None):
+    # show_review_area = not show_upload_area
+    if view is None:
+        view = load_record_view(recid)
 
-        ctx['show_upload_widget'] = (
-            ctx['show_upload_widget'] or ctx[
-                'is_submission_coordinator_or_admin'])
+    ctx['show_review_widget'] = 'reviewer' in view['participant_roles']
+    ctx['is_admin'] = view['is_admin']
+    ctx['is_submission_coordinator_or_admin'] = view['is_admin'] or view['is_coordinator']
+    ctx['show_upload_widget'] = 'uploader' in view['participant_roles'] or \
+        ctx['is_submission_coordinator_or_admin']
 
 
 def process_data_tables(ctx, data_record_query, first_data_id,
@@ -486,10 +508,11 @@ def process_data_tables(ctx, data_record_query, first_data_id,
     data_table_metadata = OrderedDict()
     ctx['show_upload_area'] = False
 
-    if ctx['show_upload_widget'] and data_record_query.count() == 0:
+    record_submissions = data_record_query.all()
+
+    if ctx['show_upload_widget'] and not record_submissions:
         ctx['show_upload_area'] = True
-    elif data_record_query.count() > 0:
-        record_submissions = data_record_query.all()
+    elif record_submissions:
         for submission_record in record_submissions:
             processed_name = "".join(submission_record.name.split())
             data_table_metadata[submission_record.id] = {
@@ -34,7 +34,8 @@ import os
 
 from invenio_db import db
 
-from hepdata.ext.elasticsearch.api import get_records_matching_field, index_record_ids
+from hepdata.ext.elasticsearch.api import get_record_matching_field
+from hepdata.ext.elasticsearch.index_queue import enqueue_record_ids
 from hepdata.modules.inspire_api.views import get_inspire_record_information
 from hepdata.modules.dashboard.views import do_finalise
 from hepdata.modules.records.utils.common import record_exists
@@ -121,11 +122,12 @@ def update_submissions(inspire_ids_to_update, force=False, only_record_informati
     migrator = Migrator()
     for index, inspire_id in enumerate(inspire_ids_to_update):
         _cleaned_id = inspire_id.replace("ins", "")
-        _matching_records = get_records_matching_field("inspire_id", _cleaned_id)
-        if len(_matching_records["hits"]["hits"]) >= 1:
-            recid = _matching_records["hits"]["hits"][0]["_source"]["recid"]
-            if "related_publication" in _matching_records["hits"]["hits"][0]["_source"]:
-                recid = _matching_records["hits"]["hits"][0]["_source"]["related_publication"]
+        _matching_record = get_record_matching_field("inspire_id", _cleaned_id,
+                                                     source=["recid", "related_publication"])
+        if _matching_record is not None:
+            recid = _matching_record["recid"]
+            if "related_publication" in _matching_record:
+                recid = _matching_record["related_publication"]
             print("The record with inspire_id {} and recid {} will be updated now".format(inspire_id, recid))
             migrator.update_file.delay(inspire_id, recid, force, only_record_information)
         else:
@@ -296,7 +298,7 @@ class Migrator(object):
             elif not only_record_information:
                 print('Not updating record {}'.format(recid))
             else:
-                index_record_ids([record_information["recid"]])
+                enqueue_record_ids([record_information["recid"]])
 
         else:
             log.error("Failed to load {0}".format(inspire_id))
@@ -23,8 +23,10 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 from invenio_pidstore.errors import PIDDoesNotExistError
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_pidstore.resolver import Resolver
 from invenio_records.api import Record
+from invenio_records.models import RecordMetadata
 import os
 from sqlalchemy.orm.exc import NoResultFound
 
@@ -205,6 +207,18 @@ def truncate_string(string, words):
     return truncated_string
 
 
+def extract_journal_info(record):
+    if record and 'type' in record:
+        if 'thesis' in record['type']:
+            if 'type' in record['dissertation']:
+                record['journal_info'] = record['dissertation']['type'] + ", " + record['dissertation'][
+                    'institution']
+            else:
+                record['journal_info'] = "PhD Thesis"
+        elif 'conferencepaper' in record['type']:
+            record['journal_info'] = "Conference Paper"
+
+
 def get_record_contents(recid):
     """
     Tries to get record from elastic search first. Failing that,
@@ -236,6 +250,37 @@ def get_record_by_id(recid):
         return None
 
 
+def get_records_by_ids(recids):
+    """
+    Loads the records of many recids with one query for the PIDs and one for
+    the record metadata, instead of resolving each recid on its own.
+
+    :param recids: list of record ids
+    :return: list of Record objects, in the order of recids. Recids
+             without a registered PID or record are left out.
+    """
+    pid_values = [str(recid) for recid in recids]
+    if not pid_values:
+        return []
+
+    pids = PersistentIdentifier.query.filter(
+        PersistentIdentifier.pid_type == 'recid',
+        PersistentIdentifier.object_type == 'rec',
+        PersistentIdentifier.status == PIDStatus.REGISTERED,
+        PersistentIdentifier.pid_value.in_(pid_values)).all()
+    uuids = dict((pid.pid_value, pid.object_uuid) for pid in pids)
+    if not uuids:
+        return []
+
+    models = RecordMetadata.query.filter(
+        RecordMetadata.id.in_(uuids.values())).all()
+    records = dict((model.id, Record(model.json, model=model))
+                   for model in models if model.json is not None)
+
+    return [records[uuids[pid_value]] for pid_value in pid_values
+            if pid_value in uuids and uuids[pid_value] in records]
+
+
 def record_exists(*args, **kwargs):
     count = HEPSubmission.query.filter_by(**kwargs).count()
     return count > 0
@@ -31,6 +31,7 @@ from sqlalchemy.exc import IntegrityError
 
 from hepdata.modules.submission.models import DataSubmission, HEPSubmission, DataResource, License
 from hepdata.modules.records.utils.common import get_record_by_id, decode_string
+from hepdata.modules.doi_banner.api import add_doi_to_banner_map, add_dois_to_banner_map
 import logging
 
 logging.basicConfig()
@@ -149,8 +150,14 @@ def reserve_doi_for_hepsubmission(hepsubmission, update=False):
         db.session.add(hepsubmission)
         db.session.commit()
 
+    dois = [hepsubmission.doi]
     if not update:
         create_doi(base_doi + ".v{0}".format(version))
+        dois.append(base_doi + ".v{0}".format(version))
+
+    # Once the map is loaded, a DOI missing from it is taken as not in HEPData
+    if hepsubmission.overall_status == 'finished':
+        add_dois_to_banner_map(dois, hepsubmission.publication_recid, hepsubmission.inspire_id)
 
 
 def reserve_dois_for_data_submissions(*args, **kwargs):
@@ -185,6 +192,22 @@ def reserve_dois_for_data_submissions(*args, **kwargs):
 
     db.session.commit()
 
+    for data_submission in data_submissions:
+        add_data_submission_to_banner_map(data_submission)
+
+
+def add_data_submission_to_banner_map(data_submission):
+    """
+    Adds the DOI of a table to the DOI banner map once its publication is finished.
+    :param data_submission: DataSubmission object with a reserved DOI
+    """
+    hep_submission = HEPSubmission.query.filter_by(
+        publication_recid=data_submission.publication_recid,
+        overall_status='finished').first()
+    if hep_submission:
+        add_doi_to_banner_map(data_submission.doi, hep_submission.publication_recid,
+                              hep_submission.inspire_id)
+
 
 def create_doi(doi):
     """
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Collection counts and latest records shown on the landing page, cached in REDIS."""
+
+import hashlib
+import json
+import logging
+import time
+
+from dateutil import parser
+from flask import current_app
+from redis.exceptions import RedisError
+
+from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
+from hepdata.ext.elasticsearch.api import get_count_for_collection, get_n_latest_records
+from hepdata.modules.records.utils.common import extract_journal_info
+from hepdata.utils.cache import get_cache_client, get_cache_key
+
+logging.basicConfig()
+log = logging.getLogger(__name__)
+
+DEFAULT_LATEST_RECORDS = 3
+MAX_LATEST_RECORDS = 50
+
+
+def compute_collection_counts():
+    pub_count = get_count_for_collection(CFG_PUB_TYPE)
+    data_count = get_count_for_collection(CFG_DATA_TYPE)
+    return {"data": data_count['count'], "publications": pub_count["count"]}
+
+
+def compute_latest_records(n):
+    result = {"latest": []}
+    for record in get_n_latest_records(n):
+        record_information = record['_source']
+        if 'recid' in record_information:
+
+            last_updated = record_information['creation_date']
+
+            if "last_updated" in record_information:
+                last_updated = record_information["last_updated"]
+                last_updated = parser.parse(last_updated).strftime("%Y-%m-%d")
+
+            extract_journal_info(record_information)
+            record_information['author_count'] = len(record_information.get('summary_authors', []))
+            record_information['last_updated'] = last_updated
+            result['latest'].append(record_information)
+
+    return result
+
+
+def _make_entry(result):
+    """ Wraps a result with the validators used for the HTTP cache headers. """
+    return {
+        "result": result,
+        "etag": hashlib.sha1(json.dumps(result, sort_keys=True)).hexdigest(),
+        "last_modified": int(time.time())
+    }
+
+
+def _get_generation(client):
+    generation = client.get(get_cache_key('landing', 'generation'))
+    return int(generation) if generation else 0
+
+
+def _get_entry_key(client, *parts):
+    return get_cache_key('landing', _get_generation(client), *parts)
+
+
+def _get_cached_entry(parts, compute_function):
+    ttl = current_app.config.get('LANDING_PAGE_CACHE_TTL', 0)
+    if not ttl:
+        return _make_entry(compute_function())
+
+    try:
+        client = get_cache_client()
+        key = _get_entry_key(client, *parts)
+        cached = client.get(key)
+        if cached:
+            return json.loads(cached)
+    except RedisError as e:
+        log.error('Unable to read the landing page cache: {0}'.format(e))
+        return _make_entry(compute_function())
+
+    entry = _make_entry(compute_function())
+    try:
+        client.setex(key, ttl, json.dumps(entry))
+    except RedisError as e:
+        log.error('Unable to write the landing page cache: {0}'.format(e))
+    return entry
+
+
+def get_collection_counts():
+    """
+    :return: [dict] with the result and its etag and last_modified timestamp
+    """
+    return _get_cached_entry(['counts'], compute_collection_counts)
+
+
+def get_latest_records(n=DEFAULT_LATEST_RECORDS):
+    """
+    :param n: number of records, at most MAX_LATEST_RECORDS
+    :return: [dict] with the result and its etag and last_modified timestamp
+    """
+    n = max(1, min(n, MAX_LATEST_RECORDS))
+    return _get_cached_entry(['latest', n], lambda: compute_latest_records(n))
+
+
+def refresh_landing_page_cache():
+    """
+    Drops the cached counts and latest records, and computes the ones
+    requested by the landing page again. Called whenever a record is
+    finalised or removed.
+    """
+    if not current_app.config.get('LANDING_PAGE_CACHE_TTL', 0):
+        return
+
+    try:
+        get_cache_client().incr(get_cache_key('landing', 'generation'))
+    except RedisError as e:
+        log.error('Unable to refresh the landing page cache: {0}'.format(e))
+        return
+
+    get_collection_counts()
+    get_latest_records()
@@ -37,11 +37,14 @@ from flask.ext.celeryext import create_celery_app
 from flask.ext.login import current_user
 from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
 from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
-from hepdata.ext.elasticsearch.api import get_records_matching_field, \
-    delete_item_from_index, index_record_ids, push_data_keywords
+from hepdata.ext.elasticsearch.api import get_record_ids_matching_field, \
+    get_records_matching_values, delete_item_from_index, refresh_index
+from hepdata.ext.elasticsearch.index_queue import index_now
 from hepdata.modules.converter.tasks import convert_and_store
+from hepdata.modules.doi_banner.api import add_dois_to_banner_map, remove_dois_from_banner_map
 from hepdata.modules.email.api import send_finalised_email
 from hepdata.modules.permissions.models import SubmissionParticipant
+from hepdata.modules.records.utils.landing_page import refresh_landing_page_cache
 from hepdata.modules.records.utils.workflow import create_record
 from hepdata.modules.submission.api import get_latest_hepsubmission
 from hepdata.modules.submission.models import DataSubmission, DataReview, \
@@ -137,14 +140,13 @@ def remove_submission(record_id):
 
         try:
             record = get_record_by_id(record_id)
-            data_records = get_records_matching_field(
+            data_record_ids = get_record_ids_matching_field(
                 'related_publication', record_id, doc_type=CFG_DATA_TYPE)
 
-            if 'hits' in data_records:
-                for data_record in data_records['hits']['hits']:
-                    data_record_obj = get_record_by_id(data_record['_source']['recid'])
-                    if data_record_obj:
-                        data_record_obj.delete()
+            for data_record_id in data_record_ids:
+                data_record_obj = get_record_by_id(data_record_id)
+                if data_record_obj:
+                    data_record_obj.delete()
             if record:
                 record.delete()
 
@@ -666,24 +668,41 @@ def create_data_review(data_recid, publication_recid, version=1):
     return None
 
 
+def get_submission_dois(record_id):
+    """ :return: the DOIs of the publication, its versions and its tables """
+    record = get_record_by_id(record_id)
+    dois = [record.get('doi')] if record else []
+    dois += [doi for doi, in db.session.query(HEPSubmission.doi).filter_by(publication_recid=record_id)]
+    dois += [doi for doi, in db.session.query(DataSubmission.doi).filter_by(publication_recid=record_id)]
+    return dois
+
+
 def unload_submission(record_id):
     print('unloading {}...'.format(record_id))
+    dois = get_submission_dois(record_id)
     remove_submission(record_id)
+    remove_dois_from_banner_map(dois)
 
-    data_records = get_records_matching_field("related_publication", record_id)
-    for record in data_records["hits"]["hits"]:
-        print("\t Removed data table {0} from index".format(record["_id"]))
+    data_record_ids = get_record_ids_matching_field("related_publication", record_id,
+                                                    doc_type=CFG_DATA_TYPE)
+    for data_record_id in data_record_ids:
+        print("\t Removed data table {0} from index".format(data_record_id))
         try:
-            delete_item_from_index(doc_type=CFG_DATA_TYPE, id=record["_id"], parent=record_id)
+            delete_item_from_index(doc_type=CFG_DATA_TYPE, id=data_record_id, parent=record_id,
+                                   refresh=False)
         except Exception as e:
-            logging.error("Unable to remove {0} from index. {1}".format(record["_id"], e))
+            logging.error("Unable to remove {0} from index. {1}".format(data_record_id, e))
 
     try:
-        delete_item_from_index(doc_type=CFG_PUB_TYPE, id=record_id)
+        delete_item_from_index(doc_type=CFG_PUB_TYPE, id=record_id, refresh=False)
         print("Removed publication {0} from index".format(record_id))
     except NotFoundError as nfe:
         print(nfe.message)
 
+    # the landing page must not be computed while the record is still searchable
+    refresh_index()
+    refresh_landing_page_cache()
+
     print('Finished unloading {0}.'.format(record_id))
 
 
@@ -714,18 +733,19 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
         version = hep_submission.version
 
         existing_submissions = {}
+        existing_tables = []
         if hep_submission.version > 1 or update:
             # we need to determine which are the existing record ids.
-            existing_data_records = get_records_matching_field(
-                'related_publication', recid, doc_type=CFG_DATA_TYPE)
+            existing_data_records = get_records_matching_values(
+                'related_publication', [recid], doc_type=CFG_DATA_TYPE,
+                source=['recid', 'title', 'related_publication'])
 
-            for record in existing_data_records["hits"]["hits"]:
+            for record in existing_data_records:
 
                 if "recid" in record["_source"]:
                     existing_submissions[record["_source"]["title"]] = \
                         record["_source"]["recid"]
-                    delete_item_from_index(record["_id"],
-                                           doc_type=CFG_DATA_TYPE, parent=record["_source"]["related_publication"])
+                    existing_tables.append(record)
 
         current_time = "{:%Y-%m-%d %H:%M:%S}".format(datetime.now())
 
@@ -766,6 +786,10 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
 
             db.session.commit()
 
+            add_dois_to_banner_map([record.get('doi'), hep_submission.doi] +
+                                   [submission.doi for submission in submissions],
+                                   recid, hep_submission.inspire_id)
+
             create_celery_app(current_app)
 
             # only mint DOIs if not testing.
@@ -773,9 +797,10 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
                 generate_dois_for_submission.delay(inspire_id=hep_submission.inspire_id, version=version)
                 log.info("Generated DOIs for ins{0}".format(hep_submission.inspire_id))
 
-            # Reindex everything.
-            index_record_ids([recid] + generated_record_ids)
-            push_data_keywords(pub_ids=[recid])
+            # Reindex everything straight away, so the record is never
+            # searchable without its tables.
+            index_now([recid] + generated_record_ids)
+            remove_stale_tables_from_index(existing_tables, generated_record_ids)
 
             try:
                 admin_indexer = AdminIndexer()
@@ -807,6 +832,24 @@ def do_finalise(recid, publication_record=None, force_finalise=False,
                         "submission. Only coordinators can do that."]})
 
 
+def remove_stale_tables_from_index(existing_tables, generated_record_ids):
+    """
+    Removes the tables of the previous version that the new version no longer
+    has. Tables kept by the new version reuse their recid and were reindexed.
+    :param existing_tables: index hits of the tables of the previous version
+    :param generated_record_ids: recids of the tables of the new version
+    """
+    kept_recids = set(int(recid) for recid in generated_record_ids)
+    stale_tables = [record for record in existing_tables
+                    if int(record["_source"]["recid"]) not in kept_recids]
+    for record in stale_tables:
+        delete_item_from_index(record["_id"], doc_type=CFG_DATA_TYPE,
+                               parent=record["_source"]["related_publication"], refresh=False)
+
+    if stale_tables:
+        refresh_index()
+
+
 def finalise_datasubmission(current_time, existing_submissions,
                             generated_record_ids, publication_record, recid,
                             submission, version):
@@ -28,6 +28,7 @@ import uuid
 from invenio_pidstore.minters import recid_minter
 from invenio_records import Record
 
+from hepdata.modules.doi_banner.api import add_doi_to_banner_map
 from hepdata.modules.permissions.models import SubmissionParticipant
 from invenio_db import db
 
@@ -88,6 +89,8 @@ def update_record(recid, ctx):
     record.commit()
     db.session.commit()
 
+    add_doi_to_banner_map(record.get('doi'), recid, record.get('inspire_id'))
+
     return record
 
 
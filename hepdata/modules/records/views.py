@@ -28,7 +28,7 @@ from __future__ import absolute_import, print_function
 
 import logging
 import json
-from dateutil import parser
+from datetime import datetime
 from flask.ext.login import login_required
 from flask import Blueprint, send_file, abort
 import jsonpatch
@@ -38,13 +38,15 @@ try:
 except ImportError: #pragma: no cover
     from yaml import SafeLoader as Loader #pragma: no cover
 from invenio_db import db
+from sqlalchemy.orm.exc import NoResultFound
 
-from hepdata.config import CFG_DATA_TYPE, CFG_PUB_TYPE
-from hepdata.ext.elasticsearch.api import get_records_matching_field, get_count_for_collection, get_n_latest_records, \
-    index_record_ids
+from hepdata.config import CFG_PUB_TYPE
+from hepdata.ext.elasticsearch.api import get_record_matching_field
+from hepdata.ext.elasticsearch.index_queue import enqueue_record_ids
 from hepdata.modules.email.api import send_new_upload_email, send_new_review_message_email, NoReviewersException, \
     send_question_email
 from hepdata.modules.inspire_api.views import get_inspire_record_information
+from hepdata.modules.permissions.api import user_allowed_to_perform_action
 from hepdata.modules.records.api import *
 from hepdata.modules.submission.models import HEPSubmission, DataSubmission, \
     DataResource, DataReview, Message, Question
@@ -52,6 +54,8 @@ from hepdata.modules.records.utils.common import get_record_by_id, \
     default_time, IMAGE_TYPES
 from hepdata.modules.records.utils.data_processing_utils import \
     generate_table_structure
+from hepdata.modules.records.utils.landing_page import get_collection_counts, get_latest_records, \
+    DEFAULT_LATEST_RECORDS
 from hepdata.modules.records.utils.submission import create_data_review, \
     get_or_create_hepsubmission
 from hepdata.modules.submission.api import get_latest_hepsubmission
@@ -95,9 +99,8 @@ def get_metadata_by_alternative_id(recid):
     try:
         if "ins" in recid:
             recid = recid.replace("ins", "")
-            record = get_records_matching_field('inspire_id', recid,
-                                                doc_type=CFG_PUB_TYPE)
-            record = record['hits']['hits'][0].get("_source")
+            record = get_record_matching_field('inspire_id', recid,
+                                               doc_type=CFG_PUB_TYPE)
             version = int(request.args.get('version', -1))
 
             output_format = request.args.get('format', 'html')
@@ -171,13 +174,23 @@ def metadata(recid):
                          light_mode=light_mode)
 
 
+def make_cached_json_response(entry):
+    """
+    Returns a cache entry as JSON with ETag and Last-Modified headers,
+    answering with 304 Not Modified when the client copy is still valid.
+    :param entry: [dict] with result, etag and last_modified
+    """
+    response = jsonify(entry['result'])
+    response.set_etag(entry['etag'])
+    response.last_modified = datetime.utcfromtimestamp(entry['last_modified'])
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
 @blueprint.route('/count')
 def get_count_stats():
-    pub_count = get_count_for_collection(CFG_PUB_TYPE)
-    data_count = get_count_for_collection(CFG_DATA_TYPE)
-
-    return jsonify(
-        {"data": data_count['count'], "publications": pub_count["count"]})
+    return make_cached_json_response(get_collection_counts())
 
 
 @blueprint.route('/latest')
@@ -187,25 +200,8 @@ def get_latest():
     :param n:
     :return:
     """
-    n = int(request.args.get('n', 3))
-    latest_records = get_n_latest_records(n)
-    result = {"latest": []}
-    for record in latest_records:
-        record_information = record['_source']
-        if 'recid' in record_information:
-
-            last_updated = record_information['creation_date']
-
-            if "last_updated" in record_information:
-                last_updated = record_information["last_updated"]
-                last_updated = parser.parse(last_updated).strftime("%Y-%m-%d")
-
-            extract_journal_info(record_information)
-            record_information['author_count'] = len(record_information.get('summary_authors', []))
-            record_information['last_updated'] = last_updated
-            result['latest'].append(record_information)
-
-    return jsonify(result)
+    n = int(request.args.get('n', DEFAULT_LATEST_RECORDS))
+    return make_cached_json_response(get_latest_records(n))
 
 
 @blueprint.route('/data/<int:recid>/<int:data_recid>/<int:version>', methods=['GET', ])
@@ -701,7 +697,7 @@ def add_resource(type, identifier, version):
                 db.session.commit()
 
                 try:
-                    index_record_ids([recid])
+                    enqueue_record_ids([recid])
                 except:
                     log.error('Failed to reindex {0}'.format(recid))
 
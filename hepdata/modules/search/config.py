@@ -18,6 +18,9 @@
 #
 
 HEPDATA_CFG_MAX_RESULTS_PER_PAGE = 25
+HEPDATA_CFG_EXPORT_PAGE_SIZE = 100
+HEPDATA_CFG_SCROLL_TIMEOUT = '1m'
+HEPDATA_CFG_MAX_AUTHOR_SUGGESTIONS = 10
 HEPDATA_CFG_FACETS = ['author',
                       'collaboration',
                       'date',
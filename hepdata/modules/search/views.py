@@ -21,14 +21,18 @@ from __future__ import division
 import json
 
 import sys
-from flask import Blueprint, request, render_template, jsonify
-from hepdata.config import CFG_DATA_KEYWORDS
+from elasticsearch.exceptions import NotFoundError, RequestError
+from flask import Blueprint, request, render_template, jsonify, Response, \
+    stream_with_context
 from hepdata.ext.elasticsearch.api import search as es_search, \
-    search_authors as es_search_authors
+    search_authors as es_search_authors, scroll_search as es_scroll_search, \
+    iterate_search as es_iterate_search, suggest_authors as es_suggest_authors
+from hepdata.ext.elasticsearch.cache import cached_search
+from hepdata.ext.elasticsearch.instrumentation import get_active_search_timer
 from hepdata.modules.records.utils.common import decode_string
-from hepdata.utils.session import get_session_item, set_session_item
 from hepdata.utils.url import modify_query
-from config import HEPDATA_CFG_MAX_RESULTS_PER_PAGE, HEPDATA_CFG_FACETS
+from config import HEPDATA_CFG_MAX_RESULTS_PER_PAGE, HEPDATA_CFG_FACETS, \
+    HEPDATA_CFG_SCROLL_TIMEOUT, HEPDATA_CFG_EXPORT_PAGE_SIZE, HEPDATA_CFG_MAX_AUTHOR_SUGGESTIONS
 
 blueprint = Blueprint('es_search',
                       __name__,
@@ -37,6 +41,15 @@ blueprint = Blueprint('es_search',
                       static_folder='static')
 
 
+@blueprint.after_request
+def add_server_timing_header(response):
+    """ Exposes the phase timings of sampled searches to the browser. """
+    timer = get_active_search_timer()
+    if timer is not None and timer.phases:
+        response.headers['Server-Timing'] = timer.to_server_timing()
+    return response
+
+
 def calculate_total_pages(query_result, max_results):
     """ Calculate the overall number of pages of results
     given the number of hits and max number of records displayed per page """
@@ -120,18 +133,10 @@ def sort_facets(facets):
     return facets
 
 
-def filter_facets(facets, total_hits):
-    """ For the data keywords, show only the ones with >10 count,
-    if there is more than 100 hits altogether. Filter out the empty ones. """
-    HITS = 50
-    THRESHOLD = 10
-
-    if total_hits > HITS:
-        keyword_facets = [f for f in facets if f['type'] in CFG_DATA_KEYWORDS]
-        for facet in keyword_facets:
-            vals = [v for v in facet['vals'] if v['doc_count'] >= THRESHOLD]
-            facet['vals'] = vals
-
+def filter_facets(facets):
+    """ Filter out the empty facets. The aggregations only return the most
+    frequent values of each facet, see SEARCH_FACET_SIZES and
+    SEARCH_FACET_MIN_DOC_COUNT. """
     nonempty_facets = [kf for kf in facets if len(kf['vals']) > 0]
 
     return nonempty_facets
@@ -173,52 +178,105 @@ def search_authors():
     return jsonify({'results': results})
 
 
+@blueprint.route('/authors/suggest', methods=['GET'])
+def suggest_authors():
+    """ Typeahead endpoint returning the author names starting with q. """
+    prefix = request.args.get('q', '')
+    results = es_suggest_authors(prefix, size=HEPDATA_CFG_MAX_AUTHOR_SUGGESTIONS)
+    return jsonify({'results': results})
+
+
 def get_facet(facets, facet_name):
     for facet in facets:
-        if facet['printable_name'] is facet_name:
+        if facet['printable_name'] == facet_name:
             return facet['vals']
     return None
 
 
-def process_year_facet(request, facets):
-    url_path = modify_query('.search', **{'date': None})
-    year_facet = get_session_item(url_path)
-    if len(year_facet) == 0 or (request.full_path[:-1] == url_path or request.full_path == url_path):
-        # we update the facet if there is no value stored in the session,
-        # or if the base url is the same as the stripped url
-        year_facet = get_facet(facets, 'Date')
-        if year_facet:
-            year_facet = {decode_string(json.dumps(year_facet))}
-            set_session_item(url_path, year_facet)
-
-    if year_facet and len(year_facet) > 0:
-        year_facet = list(year_facet)[0]
+def process_year_facet(facets):
+    """ Returns the JSON encoded date facet used for the year histogram.
+    The date histogram is computed without the date filter, so it covers
+    every year matching the rest of the search. """
+    year_facet = get_facet(facets, 'Date')
+    if year_facet:
+        year_facet = decode_string(json.dumps(year_facet))
 
     return year_facet
 
 
+def search_with_cursor(query_params, cursor=None):
+    """ Perform a scrolled search returning the first page of results,
+    or the page following the given cursor, with the cursor to the next
+    page. """
+    if cursor:
+        query_result = es_scroll_search(cursor, scroll=HEPDATA_CFG_SCROLL_TIMEOUT)
+    else:
+        query_result = es_search(query_params['q'],
+                                 filters=query_params['filters'],
+                                 size=query_params['size'],
+                                 sort_field=query_params['sorting_field'],
+                                 sort_order=query_params['sorting_order'],
+                                 scroll=HEPDATA_CFG_SCROLL_TIMEOUT)
+
+    query_result['cursor'] = query_result.pop('scroll_id', None)
+    query_result['hits'] = {'total': query_result['total']}
+    return query_result
+
+
+@blueprint.route('/export', methods=['GET'])
+def export():
+    """ Stream all the results of a search as newline-delimited JSON,
+    one publication with its data tables per line. """
+    query_params = parse_query_parameters(request.args)
+
+    def generate():
+        for publication in es_iterate_search(query_params['q'],
+                                             filters=query_params['filters'],
+                                             sort_field=query_params['sorting_field'],
+                                             sort_order=query_params['sorting_order'],
+                                             page_size=HEPDATA_CFG_EXPORT_PAGE_SIZE):
+            yield json.dumps(publication) + '\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
 @blueprint.route('/', methods=['GET', 'POST'])
 def search():
     """ Main search endpoint.
     Parse the request, perform search and show the results """
     query_params = parse_query_parameters(request.args)
 
-    query_result = es_search(query_params['q'],
-                             filters=query_params['filters'],
-                             size=query_params['size'],
-                             sort_field=query_params['sorting_field'],
-                             sort_order=query_params['sorting_order'],
-                             offset=query_params['offset'])
+    if 'cursor' in request.args or 'scroll' in request.args:
+        cursor = request.args.get('cursor')
+        try:
+            return jsonify(search_with_cursor(query_params, cursor))
+        except (NotFoundError, RequestError):
+            if not cursor:
+                raise
+            # ES forgets a scroll once its timeout has passed
+            return jsonify({"success": False,
+                            "message": "The cursor has expired or is not valid. "
+                                       "Restart the search with scroll=1."}), 404
+
+    query_result = cached_search(
+        query_params,
+        lambda: es_search(query_params['q'],
+                          filters=query_params['filters'],
+                          size=query_params['size'],
+                          sort_field=query_params['sorting_field'],
+                          sort_order=query_params['sorting_order'],
+                          offset=query_params['offset']))
 
     total_pages = calculate_total_pages(query_result, query_params['size'])
 
     if query_params['current_page'] > total_pages:
         query_params['current_page'] = total_pages
 
-    facets = filter_facets(query_result['facets'], query_result['total'])
+    facets = filter_facets(query_result['facets'])
     facets = sort_facets(facets)
 
-    year_facet = process_year_facet(request, facets)
+    year_facet = process_year_facet(facets)
 
     if ('format' in request.args and request.args['format'] == 'json') \
         or 'json' in request.headers['accept']:
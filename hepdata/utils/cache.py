@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of HEPData.
+# Copyright (C) 2016 CERN.
+#
+# HEPData is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# HEPData is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with HEPData; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Provides access to the shared REDIS cache"""
+
+import redis
+from flask import current_app
+
+_clients = {}
+
+
+def get_cache_client():
+    """
+    Returns a REDIS client for the cache instance set as CACHE_REDIS_URL.
+    Clients are created once per URL and shared by the whole process.
+    :return: redis.StrictRedis
+    """
+    url = current_app.config['CACHE_REDIS_URL']
+    if url not in _clients:
+        _clients[url] = redis.StrictRedis.from_url(url)
+    return _clients[url]
+
+
+def get_cache_key(*parts):
+    """
+    Builds a cache key prefixed with CACHE_KEY_PREFIX.
+    :param parts: e.g. 'search', 'generation'
+    :return: e.g. 'cache::search::generation'
+    """
+    return current_app.config.get('CACHE_KEY_PREFIX', '') + \
+        '::'.join(str(part) for part in parts)
@@ -108,7 +108,8 @@ install_requires = [
     'Flask-Login<0.4.0',
     'oauthlib!=2.0.0,>=1.1.2',
     'twitter',
-    'psycopg2'
+    'psycopg2',
+    'redis'
 ]
 
 packages = find_packages()
@@ -195,6 +196,7 @@ setup(
             'hepdata_doi = hepdata.modules.records.utils.doi_minter',
             'hepdata_mail = hepdata.modules.email.utils',
             'hepdata_conversion = hepdata.modules.converter.tasks',
+            'hepdata_search = hepdata.ext.elasticsearch.tasks',
         ],
         'invenio_i18n.translations': [
             'messages = hepdata',
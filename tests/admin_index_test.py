@@ -20,8 +20,10 @@ from time import sleep
 
 import pytest
 from elasticsearch_dsl import Index
+from mock import patch
 
-from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer
+from hepdata.ext.elasticsearch.admin_view.api import AdminIndexer, MAX_SUMMARY_SIZE
+from hepdata.modules.submission.models import HEPSubmission
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
@@ -68,9 +70,45 @@ def test_summary(admin_idx):
     summary = admin_idx.get_summary()
     assert (summary is not None)
     assert (len(summary) == 3)
+    assert ([submission['last_updated'] for submission in summary] == ['2016-06-01', '2016-06-02', '2016-06-02'])
+
+
+def test_summary_window_and_pagination(admin_idx):
+    assert (len(admin_idx.get_summary(from_date='2016-06-02')) == 2)
+    assert (len(admin_idx.get_summary(to_date='2016-06-01')) == 1)
+
+    first_page = admin_idx.get_summary(offset=0, size=2)
+    second_page = admin_idx.get_summary(offset=2, size=2)
+    assert (len(first_page) == 2)
+    assert (len(second_page) == 1)
+    assert (second_page[0]['recid'] not in [submission['recid'] for submission in first_page])
+
+    # ES 2.x rejects pages past the result window
+    assert (admin_idx.get_summary(offset=MAX_SUMMARY_SIZE - 1, size=10) == [])
+    assert (admin_idx.get_summary(offset=MAX_SUMMARY_SIZE, size=10) == [])
 
 
 def test_find_and_delete(admin_idx):
     delete_count, success = admin_idx.find_and_delete(term='ATLAS', fields=['collaboration'])
     assert (success)
     assert (delete_count == 2)
+
+
+def test_generate_actions(admin_idx):
+    submissions = [HEPSubmission(publication_recid=1, inspire_id='122111', version=2, overall_status='finished'),
+                   HEPSubmission(publication_recid=2, inspire_id='122112', version=1, overall_status='todo')]
+
+    with patch('hepdata.ext.elasticsearch.admin_view.api.fetch_records',
+               return_value={1: {'title': 'Test Submission', 'collaborations': ['ATLAS']}}) as fetch, \
+            patch('hepdata.ext.elasticsearch.admin_view.api.get_records_by_ids', return_value=[]) as get_records, \
+            patch.object(AdminIndexer, 'get_data_counts', return_value={(1, 2): 5}):
+        actions = list(admin_idx.generate_actions(submissions))
+
+        assert (fetch.call_count == 1)
+        get_records.assert_called_once_with([2])
+
+    assert (len(actions) == 1)
+    assert (actions[0]['_id'] == 1)
+    assert (actions[0]['_index'] == admin_idx.index)
+    assert (actions[0]['_source']['data_count'] == 5)
+    assert (actions[0]['_source']['collaboration'] == 'ATLAS')
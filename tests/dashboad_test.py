@@ -20,3 +20,33 @@
 # In applying this license, CERN does not
 # waive the privileges and immunities granted to it by virtue of its status
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""HEPData dashboard test cases."""
+import json
+
+from flask_login import login_user
+from invenio_accounts.models import User
+from mock import patch
+
+from hepdata.ext.elasticsearch.admin_view.api import DEFAULT_SUMMARY_SIZE, MAX_SUMMARY_SIZE
+from hepdata.modules.dashboard.views import submissions_list
+from tests.conftest import TEST_EMAIL
+
+
+def test_submissions_list_is_paginated(app):
+    with app.app_context():
+        user = User.query.filter_by(email=TEST_EMAIL).first()
+
+        with patch('hepdata.modules.dashboard.views.AdminIndexer') as indexer:
+            indexer.return_value.get_summary.return_value = []
+
+            with app.test_request_context('/dashboard/submissions/list?page=2'):
+                login_user(user)
+                assert (json.loads(submissions_list().data) == [])
+                assert (indexer.return_value.get_summary.call_args[1]['offset'] == DEFAULT_SUMMARY_SIZE)
+                assert (indexer.return_value.get_summary.call_args[1]['size'] == DEFAULT_SUMMARY_SIZE)
+
+            with app.test_request_context('/dashboard/submissions/list?size=20000'):
+                login_user(user)
+                submissions_list()
+                assert (indexer.return_value.get_summary.call_args[1]['size'] == MAX_SUMMARY_SIZE)
@@ -24,8 +24,16 @@
 """HEPData utils test cases."""
 import os
 
+from mock import patch
+
+from hepdata.modules.doi_banner.api import get_record_for_doi, add_doi_to_banner_map, \
+    clear_local_cache, remove_dois_from_banner_map, load_doi_map, is_doi_map_loaded
+from hepdata.modules.records.utils.doi_minter import reserve_doi_for_hepsubmission
+from hepdata.modules.records.utils.workflow import update_record
+from hepdata.modules.submission.models import HEPSubmission
 from hepdata.utils.file_extractor import extract, get_file_in_directory
 from hepdata.utils.miscellanous import splitter
+from tests.conftest import FakeRedis
 
 
 def test_utils():
@@ -62,3 +70,99 @@ def test_file_extractor(app):
             file = get_file_in_directory(extract_dir, 'yaml')
             assert (file is not None)
 
+
+
+def test_doi_banner_lookups_are_cached(app):
+    with app.app_context():
+        clear_local_cache()
+        with patch('hepdata.modules.doi_banner.api.get_cache_client', return_value=FakeRedis()), \
+                patch('hepdata.modules.doi_banner.api.get_record_matching_field') as lookup:
+            lookup.side_effect = lambda field, doi, source: \
+                {'recid': 1, 'inspire_id': '1245023'} if doi == '10.1000/182' else None
+
+            assert (get_record_for_doi('10.1000/182') == 'ins1245023')
+            assert (get_record_for_doi('10.1000/missing') is None)
+
+            clear_local_cache()
+            assert (get_record_for_doi('10.1000/182') == 'ins1245023')
+            assert (get_record_for_doi('10.1000/missing') is None)
+            assert (lookup.call_count == 2)
+
+            add_doi_to_banner_map('10.1000/missing', 2, 1283842)
+            assert (get_record_for_doi('10.1000/missing') == 'ins1283842')
+            assert (lookup.call_count == 2)
+
+            # once removed, the DOI is looked up again
+            remove_dois_from_banner_map(['10.1000/missing', None])
+            assert (get_record_for_doi('10.1000/missing') is None)
+            assert (lookup.call_count == 3)
+        clear_local_cache()
+
+
+
+def test_doi_banner_finds_records_without_inspire_id(app):
+    with app.app_context():
+        clear_local_cache()
+        with patch('hepdata.modules.doi_banner.api.get_cache_client', return_value=FakeRedis()), \
+                patch('hepdata.modules.doi_banner.api.get_record_matching_field') as lookup:
+            lookup.side_effect = lambda field, doi, source: {
+                '10.1000/publication': {'recid': 5},
+                '10.1000/table': {'recid': 7, 'related_publication': 5}}.get(doi)
+
+            assert (get_record_for_doi('10.1000/publication') == '5')
+            assert (get_record_for_doi('10.1000/table') == '5')
+
+            clear_local_cache()
+            assert (get_record_for_doi('10.1000/publication') == '5')
+            assert (lookup.call_count == 2)
+
+            add_doi_to_banner_map('10.1000/added', 6)
+            assert (get_record_for_doi('10.1000/added') == '6')
+            assert (lookup.call_count == 2)
+        clear_local_cache()
+
+class _Record(dict):
+    def commit(self):
+        pass
+
+
+def test_doi_banner_map_follows_record_updates(app):
+    with app.app_context():
+        clear_local_cache()
+        with patch('hepdata.modules.doi_banner.api.get_cache_client', return_value=FakeRedis()), \
+                patch('hepdata.modules.doi_banner.api.get_records_with_field', return_value=[]), \
+                patch('hepdata.modules.doi_banner.api.get_record_matching_field') as lookup, \
+                patch('hepdata.modules.records.utils.workflow.get_record_by_id', return_value=_Record()), \
+                patch('hepdata.modules.records.utils.workflow.db'):
+            load_doi_map()
+            assert (is_doi_map_loaded())
+            assert (get_record_for_doi('10.1000/updated') is None)
+
+            # a DOI added to an existing record after the map was loaded
+            update_record(1, {'doi': '10.1000/updated', 'inspire_id': 1300000})
+            clear_local_cache()
+            assert (get_record_for_doi('10.1000/updated') == 'ins1300000')
+            assert (lookup.call_count == 0)
+        clear_local_cache()
+
+
+def test_reserved_dois_are_added_to_banner_map(app):
+    hepsubmission = HEPSubmission(publication_recid=10, inspire_id='1300001', version=2,
+                                  overall_status='finished')
+
+    with app.app_context():
+        clear_local_cache()
+        with patch('hepdata.modules.doi_banner.api.get_cache_client', return_value=FakeRedis()), \
+                patch('hepdata.modules.doi_banner.api.get_records_with_field', return_value=[]), \
+                patch('hepdata.modules.doi_banner.api.get_record_matching_field') as lookup, \
+                patch('hepdata.modules.records.utils.doi_minter.create_doi'), \
+                patch('hepdata.modules.records.utils.doi_minter.db'):
+            load_doi_map()
+            reserve_doi_for_hepsubmission(hepsubmission)
+            clear_local_cache()
+
+            base_doi = '{0}/hepdata.10'.format(app.config['DOI_PREFIX'])
+            assert (get_record_for_doi(base_doi) == 'ins1300001')
+            assert (get_record_for_doi(base_doi + '.v2') == 'ins1300001')
+            assert (lookup.call_count == 0)
+        clear_local_cache()
@@ -22,15 +22,22 @@
 # as an Intergovernmental Organization or submit itself to any jurisdiction.
 
 """HEPData records test cases."""
+import json
 import os
 
 import yaml
+from flask_login import login_user, logout_user
+from mock import patch
 from invenio_accounts.models import User
+from invenio_db import db
+from sqlalchemy import event
 
-from hepdata.modules.records.utils.common import get_record_by_id, record_exists
+from hepdata.modules.records.api import format_submission
+from hepdata.modules.records.utils.common import get_record_by_id, get_records_by_ids, record_exists
 from hepdata.modules.records.utils.data_processing_utils import generate_table_structure
 from hepdata.modules.records.utils.users import get_coordinators_in_system, has_role
 from hepdata.modules.records.utils.workflow import update_record, create_record
+from hepdata.modules.submission.models import HEPSubmission, DataSubmission
 from tests.conftest import TEST_EMAIL
 
 
@@ -60,6 +67,18 @@ def test_record_update(app):
         assert (updated_record['journal_info'] == 'test')
 
 
+def test_get_records_by_ids(app):
+    """___test_get_records_by_ids___"""
+    with app.app_context():
+        first = create_record({'journal_info': 'Phys. Letts', 'title': 'First Paper'})
+        second = create_record({'journal_info': 'Phys. Letts', 'title': 'Second Paper'})
+
+        records = get_records_by_ids([second['recid'], 999999, first['recid']])
+        assert ([record['title'] for record in records] == ['Second Paper', 'First Paper'])
+        assert (records[0].id == get_record_by_id(second['recid']).id)
+        assert (get_records_by_ids([]) == [])
+
+
 def test_get_record(app, client, load_default_data):
     with app.app_context():
         content = client.get('/record/1')
@@ -106,3 +125,78 @@ def test_data_processing(app):
     assert(table_structure["x_count"] == 1)
     assert(len(table_structure["headers"]) == 2)
     assert(len(table_structure["qualifiers"]) == 2)
+
+
+def test_count_stats_can_be_revalidated(app):
+    cache_ttl = app.config.get('LANDING_PAGE_CACHE_TTL')
+    app.config['LANDING_PAGE_CACHE_TTL'] = 0
+    try:
+        with patch('hepdata.modules.records.utils.landing_page.compute_collection_counts',
+                   return_value={"data": 12, "publications": 3}):
+            with app.test_client() as client:
+                response = client.get('/record/count')
+                assert (response.status_code == 200)
+                assert (json.loads(response.data) == {"data": 12, "publications": 3})
+                assert (response.headers.get('Last-Modified'))
+
+                etag = response.headers.get('ETag')
+                response = client.get('/record/count', headers={'If-None-Match': etag})
+                assert (response.status_code == 304)
+    finally:
+        app.config['LANDING_PAGE_CACHE_TTL'] = cache_ttl
+
+
+def count_queries(function):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        function()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return len(statements)
+
+
+def test_record_view_query_count(app):
+    with app.app_context():
+        user = User.query.filter_by(email=TEST_EMAIL).first()
+        record_information = create_record({'title': 'My Journal Paper'})
+        recid = record_information['recid']
+
+        hepsubmission = HEPSubmission(publication_recid=recid, coordinator=user.id,
+                                      version=1, overall_status='finished')
+        db.session.add(hepsubmission)
+        for table in range(50):
+            db.session.add(DataSubmission(publication_recid=recid, version=1, name='Table {0}'.format(table),
+                                          location_in_publication='Page {0}'.format(table),
+                                          description=b'Table description'))
+        db.session.commit()
+
+        def view():
+            # start from the state of a new request
+            db.session.expire_all()
+            ctx = format_submission(recid, {'title': 'My Journal Paper'}, 1, 1, hepsubmission)
+            assert (len(ctx['data_tables']) == 50)
+            assert (ctx['access_count'] == {'sum': 1})
+            return ctx
+
+        with app.test_request_context('/record/{0}'.format(recid)):
+            # The first view creates the reviews of the tables
+            view()
+
+            anonymous_count = count_queries(view)
+
+            login_user(user)
+            coordinator_count = count_queries(view)
+            logout_user()
+
+        # The number of queries does not grow with the number of tables.
+        # Anonymous: submissions with the access count, participants, commit
+        # message, resources, tables, and reviews with their messages.
+        # The coordinator also loads their user, their roles and whether
+        # they are subscribed to the record.
+        assert (anonymous_count == 7)
+        assert (coordinator_count == 10)
@@ -15,12 +15,36 @@
 # You should have received a copy of the GNU General Public License
 # along with HEPData; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
-from hepdata.ext.elasticsearch.config.es_config import default_sort_order_for_field
+import json
+import os
+import time
+from datetime import datetime
+
+import pytest
+from elasticsearch.exceptions import NotFoundError
+from flask import g
+from mock import patch, MagicMock
+
+from hepdata.ext.elasticsearch.aggregations import parse_aggregations
+from hepdata.ext.elasticsearch.api import iterate_search, get_record_matching_field, \
+    record_exists_matching_field, search, reindex_all, bulk_index, get_changed_author_documents, \
+    swap_index_alias, remove_missing_records, index_record_ids, delete_item_from_index
+from hepdata.ext.elasticsearch.cache import cached_search, bump_index_generation, \
+    get_search_cache_stats, normalise_query_parameters
+from hepdata.ext.elasticsearch.document_enhancers import enhance_publication_document, \
+    build_enhancement_context
+from hepdata.ext.elasticsearch.incremental import reindex_since, get_high_water_mark, _utc_to_local
+from hepdata.ext.elasticsearch.index_queue import enqueue_record_ids, flush
+from hepdata.ext.elasticsearch.instrumentation import get_search_timer, get_active_search_timer
+from hepdata.ext.elasticsearch.config.es_config import default_sort_order_for_field, default_aggregations
 from hepdata.ext.elasticsearch.process_results import merge_results, match_tables_to_papers, \
-    get_basic_record_information, is_datatable
-from hepdata.ext.elasticsearch.query_builder import HEPDataQueryParser
+    get_basic_record_information, is_datatable, fetch_remaining_papers, table_sort_key
+from hepdata.ext.elasticsearch.query_builder import HEPDataQueryParser, QueryBuilder
 from hepdata.ext.elasticsearch.utils import flip_sort_order, parse_and_format_date, prepare_author_for_indexing, \
-    calculate_sort_order, push_keywords
+    calculate_sort_order, push_keywords, get_author_suggest_inputs, aggregate_keywords, get_author_documents
+from hepdata.modules.search.views import filter_facets
+from hepdata.modules.submission.models import HEPSubmission, DataResource
+from tests.conftest import FakeRedis
 
 
 def test_query_parser():
@@ -38,6 +62,32 @@ def test_query_parser():
                                     "OR data_keywords.cmenergies:1.34")
 
 
+def test_query_parser_tokens():
+    parsed = HEPDataQueryParser.parse('observables:ASYM AND reactions:"P P --> P P"')
+    assert (parsed.is_structured())
+    assert (parsed.to_es_query() == {"bool": {"must": [
+        {"match": {"data_keywords.observables": {"query": "ASYM", "operator": "and"}}},
+        {"match_phrase": {"data_keywords.reactions": "P P --> P P"}}]}})
+
+    # operators are only recognised as whole words
+    parsed = HEPDataQueryParser.parse('ORGANIC ANDROID')
+    assert (not parsed.is_structured())
+    assert (parsed.to_query_string() == 'ORGANIC ANDROID')
+
+    parsed = HEPDataQueryParser.parse('higgs AND observables:SIG')
+    assert (parsed.to_es_query() == {"query_string": {
+        "query": "higgs AND data_keywords.observables:SIG", "fuzziness": "AUTO"}})
+
+    # the field only applies to the first word, as in query_string
+    parsed = HEPDataQueryParser.parse('observables:SIG higgs')
+    assert (not parsed.is_structured())
+    assert (parsed.to_es_query() == {"query_string": {
+        "query": "data_keywords.observables:SIG higgs", "fuzziness": "AUTO"}})
+
+    assert (HEPDataQueryParser.parse('').to_es_query() == {"match_all": {}})
+    assert (HEPDataQueryParser.parse('observables:ASYM') is HEPDataQueryParser.parse(' observables:ASYM'))
+
+
 def test_search():
     """
     Test the search functions work correctly, also with the new query syntax.
@@ -56,6 +106,62 @@ def test_merge_results():
     assert (merged["total"] == 1)
 
 
+def test_merge_results_with_inner_hits():
+    pub_result = {"hits": {"total": 2, "hits": [
+        {"_id": "1", "_type": "publication", "_source": {"recid": 1},
+         "inner_hits": {"datatable": {"hits": {"total": 2, "hits": [
+             {"_id": "2", "_source": {"recid": 2, "related_publication": 1}},
+             {"_id": "3", "_source": {"recid": 3, "related_publication": 1}}]}}}},
+        {"_id": "4", "_type": "publication", "_source": {"recid": 4}}
+    ]}}
+
+    merged = merge_results(pub_result)
+    assert (len(merged["hits"]) == 4)
+    assert (merged["total"] == 2)
+    assert (len([hit for hit in merged["hits"] if is_datatable(hit)]) == 2)
+
+
+def test_add_child_inner_hits():
+    query_builder = QueryBuilder()
+    query_builder.add_child_parent_relation("datatable", related_query={"match_all": {}})
+    query_builder.add_child_inner_hits("datatable", size=5)
+
+    query = query_builder.query["query"]["filtered"]["query"]
+    assert ("has_child" in query["bool"]["must"][0]["bool"]["should"][0])
+
+    inner_hits_clause = query["bool"]["should"][0]["has_child"]
+    assert (inner_hits_clause["inner_hits"] == {"name": "datatable", "size": 5})
+    assert (inner_hits_clause["boost"] == 0)
+    assert (inner_hits_clause["query"] == {"bool": {"must": [{"match_all": {}}]}})
+
+
+def test_child_inner_hits_only_match_the_query():
+    data_query = {"query_string": {"query": "higgs"}}
+    query_builder = QueryBuilder()
+    query_builder.add_child_inner_hits("datatable", related_query=data_query)
+
+    inner_hits_clause = query_builder.query["query"]["filtered"]["query"]["bool"]["should"][0]["has_child"]
+    assert (inner_hits_clause["query"] == {"bool": {"must": [data_query]}})
+
+
+def test_default_aggregations_are_bounded(app):
+    facet_sizes = app.config.get('SEARCH_FACET_SIZES')
+    min_doc_count = app.config.get('SEARCH_FACET_MIN_DOC_COUNT')
+    app.config['SEARCH_FACET_SIZES'] = {'collaboration': 20}
+    app.config['SEARCH_FACET_MIN_DOC_COUNT'] = 2
+    try:
+        with app.app_context():
+            aggregations = default_aggregations()
+
+            assert (aggregations['collaboration']['terms']['size'] == 20)
+            assert (aggregations['collaboration']['terms']['min_doc_count'] == 2)
+            assert (aggregations['reactions']['terms']['size'] == 10)
+            assert (aggregations['nested_authors']['aggs']['author_full_names']['terms']['size'] == 10)
+    finally:
+        app.config['SEARCH_FACET_SIZES'] = facet_sizes
+        app.config['SEARCH_FACET_MIN_DOC_COUNT'] = min_doc_count
+
+
 def test_flip_sort_order():
     order = "desc"
     order = flip_sort_order(order=order)
@@ -115,6 +221,18 @@ def test_push_keywords():
         assert (ve)
 
 
+def test_aggregate_keywords():
+    keywords = [{"name": "reactions", "value": "P P --> TOP TOPBAR X"},
+                {"name": "cmenergies", "value": "7000.0"},
+                {"name": "reactions", "value": "P P --> TOP TOPBAR X"},
+                {"name": "reactions", "value": "P P --> W X"}]
+
+    assert (aggregate_keywords(keywords) == {
+        "reactions": ["P P --> TOP TOPBAR X", "P P --> W X"],
+        "cmenergies": ["7000.0"]})
+    assert (aggregate_keywords([]) == {})
+
+
 def test_prepare_authors_for_indexing(app):
     with app.app_context():
         test_document = {
@@ -127,6 +245,45 @@ def test_prepare_authors_for_indexing(app):
         bulk_doc = prepare_author_for_indexing(test_document)
 
         assert (len(bulk_doc) == 4)
+        assert (bulk_doc[1]["full_name_suggest"] == {"input": ["John"], "output": "John"})
+        assert ("full_name_suggest" not in test_document["authors"][0])
+
+
+def test_get_author_documents():
+    documents = [{"authors": [{"full_name": "John", "affiliation": "CERN"},
+                              {"full_name": "Michael"}]},
+                 {"authors": [{"full_name": "John", "affiliation": "CERN"}]},
+                 {"authors": None}]
+
+    authors = get_author_documents(documents)
+
+    assert (list(authors.keys()) == ["John", "Michael"])
+    assert (authors["John"]["content_hash"] == get_author_documents(documents[1:])["John"]["content_hash"])
+    assert (authors["John"]["content_hash"] != authors["Michael"]["content_hash"])
+
+
+def test_unchanged_authors_are_not_reindexed(app):
+    authors = get_author_documents([{"authors": [{"full_name": "John"}, {"full_name": "Michael"},
+                                                 {"full_name": "Anna"}]}])
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.mget.return_value = {"docs": [
+                {"_id": "John", "found": True, "_source": {"content_hash": authors["John"]["content_hash"]}},
+                {"_id": "Michael", "found": True, "_source": {"content_hash": "outdated"}},
+                {"_id": "Anna", "found": False}]}
+
+            changed = get_changed_author_documents(authors)
+
+            assert (list(changed.keys()) == ["Michael", "Anna"])
+            assert (es.mget.call_count == 1)
+
+
+def test_get_author_suggest_inputs():
+    suggest = get_author_suggest_inputs({"full_name": "Aad, Georges", "first_name": "Georges",
+                                         "last_name": "Aad"})
+    assert (suggest["input"] == ["Aad, Georges", "Georges", "Aad"])
+    assert (suggest["output"] == "Aad, Georges")
 
 
 def test_match_tables_to_papers():
@@ -153,6 +310,49 @@ def test_match_tables_to_papers():
     print(aggregated)
 
 
+def _match_tables_to_papers_by_scan(tables, papers):
+    """ The previous implementation, scanning all the tables for each paper. """
+    aggregated = []
+    for paper in papers:
+        relevant_tables = [t for t in tables
+                           if t['_source']['related_publication'] == int(paper['_id'])]
+        relevant_tables.sort(key=table_sort_key)
+        aggregated.append((paper, relevant_tables))
+    return aggregated
+
+
+def _generate_tables_and_papers(paper_count, tables_per_paper):
+    papers = [{"_id": str(i), "_source": {"recid": i}} for i in range(paper_count)]
+    tables = [{"_id": str(1000 * (i + 1) + j),
+               "_source": {"related_publication": i, "title": "Table {0}".format(tables_per_paper - j)}}
+              for i in range(paper_count) for j in range(tables_per_paper)]
+    return tables, papers
+
+
+def test_match_tables_to_papers_matches_scan():
+    tables, papers = _generate_tables_and_papers(5, 12)
+    # a table whose paper is not in the results is left out
+    tables.append({"_id": "99", "_source": {"related_publication": 42, "title": "Table 1"}})
+
+    aggregated = match_tables_to_papers(tables, papers)
+    assert (aggregated == _match_tables_to_papers_by_scan(tables, papers))
+    assert (all(len(paper_tables) == 12 for paper, paper_tables in aggregated))
+    assert (aggregated[0][1][0]["_source"]["title"] == "Table 1")
+
+
+@pytest.mark.skipif(not os.environ.get('HEPDATA_BENCHMARK'),
+                    reason='set HEPDATA_BENCHMARK to run the benchmarks')
+def test_match_tables_to_papers_benchmark():
+    """ Compare the one-pass grouping with a scan of all tables per paper. """
+    import timeit
+
+    for paper_count in [10, 50, 200]:
+        tables, papers = _generate_tables_and_papers(paper_count, 50)
+        one_pass = timeit.timeit(lambda: match_tables_to_papers(tables, papers), number=3)
+        by_scan = timeit.timeit(lambda: _match_tables_to_papers_by_scan(tables, papers), number=3)
+        print('{0} papers: one pass {1:.4f}s, per paper scan {2:.4f}s'.format(paper_count, one_pass, by_scan))
+
+
 def test_get_basic_record_information():
     test_record = {
         "_source": {
@@ -175,3 +375,463 @@ def test_get_basic_record_information():
 def test_is_datatable():
     assert (is_datatable({"_type": "datatable"}))
     assert (not is_datatable({"_type": "publication"}))
+
+
+def test_fetch_remaining_papers_uses_single_mget(app):
+    papers = [{"_id": "1", "_source": {"recid": 1}}]
+    tables = [
+        {"_id": "2", "_source": {"related_publication": 1, "title": "Table 1"}},
+        {"_id": "5", "_source": {"related_publication": 4, "title": "Table 1"}},
+        {"_id": "6", "_source": {"related_publication": 4, "title": "Table 2"}},
+        {"_id": "8", "_source": {"related_publication": 7, "title": "Table 1"}}
+    ]
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.mget.return_value = {"docs": [
+                {"_id": "4", "found": True, "_source": {"recid": 4}},
+                {"_id": "7", "found": True, "_source": {"recid": 7}}
+            ]}
+
+            fetch_remaining_papers(tables, papers, include="*", exclude="authors")
+
+            assert (es.mget.call_count == 1)
+            assert (es.get.call_count == 0)
+            assert (es.mget.call_args[1]["body"] == {"ids": [4, 7]})
+            assert (es.mget.call_args[1]["_source_exclude"] == "authors")
+
+    assert ([int(paper["_id"]) for paper in papers] == [1, 4, 7])
+
+
+def test_exact_lookups_use_term_queries(app):
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.search.return_value = {"hits": {"total": 1, "hits": [
+                {"_id": "1", "_source": {"inspire_id": "1245023"}}]}}
+
+            record = get_record_matching_field('doi', '10.1000/182', source=['inspire_id'])
+            assert (record == {"inspire_id": "1245023"})
+
+            body = es.search.call_args[1]['body']
+            assert (body['size'] == 1)
+            assert (body['_source'] == ['inspire_id'])
+            assert (body['query'] == {"constant_score": {"filter": {"term": {"doi": "10.1000/182"}}}})
+
+            assert (record_exists_matching_field('doi', '10.1000/182'))
+            assert (es.search.call_args[1]['body']['size'] == 0)
+            assert (es.search.call_args[1]['terminate_after'] == 1)
+
+            es.search.return_value = {"hits": {"total": 0, "hits": []}}
+            assert (get_record_matching_field('doi', '10.1000/missing') is None)
+            assert (not record_exists_matching_field('doi', '10.1000/missing'))
+
+
+def test_normalise_query_parameters():
+    params = {'q': ' higgs ', 'filters': [('collaboration', 'CMS'), ('author', 'John')],
+              'size': 10, 'offset': 0, 'sorting_field': '', 'sorting_order': '',
+              'current_page': 1, 'min_date': 0, 'max_date': 0}
+
+    normalised = normalise_query_parameters(params)
+    assert (normalised['q'] == 'higgs')
+    assert (normalised['filters'] == [['author', 'John'], ['collaboration', 'CMS']])
+    assert ('current_page' not in normalised)
+
+
+def test_cached_search(app):
+    params = {'q': '', 'filters': [], 'size': 10, 'offset': 0,
+              'sorting_field': 'date', 'sorting_order': ''}
+    calls = []
+
+    def search_function():
+        calls.append(1)
+        return {'results': [], 'facets': [], 'total': 0}
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.cache.get_cache_client', return_value=FakeRedis()):
+            result = cached_search(params, search_function)
+            assert (len(calls) == 1)
+
+            assert (cached_search(params, search_function) == result)
+            assert (len(calls) == 1)
+
+            bump_index_generation()
+            cached_search(params, search_function)
+            assert (len(calls) == 2)
+
+            assert (get_search_cache_stats() == {'hits': 1, 'misses': 2})
+
+
+def test_iterate_search(app):
+    first_page = {"_scroll_id": "scroll-1", "hits": {"total": 1, "hits": [
+        {"_id": "1", "_type": "publication",
+         "_source": {"recid": 1, "title": "Test", "creation_date": "2016-01-09"},
+         "inner_hits": {"datatable": {"hits": {"total": 1, "hits": [
+             {"_id": "2", "_source": {"recid": 2, "related_publication": 1, "title": "Table 1"}}]}}}}]}}
+    last_page = {"_scroll_id": "scroll-2", "hits": {"total": 1, "hits": []}}
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.search.return_value = first_page
+            es.scroll.return_value = last_page
+
+            publications = list(iterate_search('higgs', page_size=1))
+
+            assert (len(publications) == 1)
+            assert (publications[0]['total_tables'] == 1)
+            assert (es.search.call_args[1]['scroll'] == '5m')
+            assert ('aggs' not in es.search.call_args[1]['body'])
+            es.scroll.assert_called_once_with(scroll_id='scroll-1', scroll='5m')
+            es.clear_scroll.assert_called_once_with(scroll_id='scroll-2')
+
+
+def test_date_filter_is_not_applied_to_date_histogram():
+    query_builder = QueryBuilder()
+    query_builder.add_filters([('collaboration', 'CMS'), ('date', [2015, 2016])])
+    query_builder.add_aggregations({
+        "dates": {"date_histogram": {"field": "publication_date", "interval": "year"}},
+        "collaboration": {"terms": {"field": "collaborations.raw"}}
+    })
+
+    date_clause = {"or": [{"term": {"year": "2015"}}, {"term": {"year": "2016"}}]}
+    query = query_builder.query
+    assert (query["post_filter"] == date_clause)
+    assert (len(query["query"]["filtered"]["filter"]["and"]) == 1)
+    assert ("date_histogram" in query["aggs"]["dates"])
+    assert (query["aggs"]["collaboration"]["filter"] == date_clause)
+
+    facets = parse_aggregations({
+        "collaboration": {"doc_count": 1, "collaboration": {"buckets": [{"key": "cms", "doc_count": 1}]}},
+        "dates": {"buckets": [{"key": 1420070400000, "doc_count": 1}]}
+    })
+    collaboration_facet = [f for f in facets if f['type'] == 'collaboration'][0]
+    assert (collaboration_facet['vals'][0]['key'] == 'CMS')
+
+
+def test_search_timings_are_sampled(app):
+    es_result = {"took": 7, "hits": {"total": 1, "hits": [
+        {"_id": "1", "_type": "publication",
+         "_source": {"recid": 1, "title": "Test", "creation_date": "2016-01-09"}}]},
+        "aggregations": {}}
+
+    sample_rate = app.config.get('SEARCH_TIMING_SAMPLE_RATE')
+    app.config['SEARCH_TIMING_SAMPLE_RATE'] = 1.0
+    try:
+        with app.app_context():
+            with patch('hepdata.ext.elasticsearch.api.es') as es:
+                es.search.return_value = es_result
+                search('higgs')
+
+            timer = get_search_timer()
+            phases = [phase['name'] for phase in timer.phases]
+            assert (phases == ['build', 'es-search', 'merge', 'parents', 'map', 'aggregations'])
+            assert (timer.phases[1]['took_ms'] == 7)
+            assert ('es-search;dur=' in timer.to_server_timing())
+            assert ('desc="took 7ms"' in timer.to_server_timing())
+            assert (get_active_search_timer() is timer)
+
+        # requests which did not search are not timed
+        with app.app_context():
+            assert (get_active_search_timer() is None)
+            assert (not hasattr(g, 'search_timer'))
+    finally:
+        app.config['SEARCH_TIMING_SAMPLE_RATE'] = sample_rate
+
+
+def test_reindex_all_resumes_from_checkpoints(app, tmpdir):
+    recids = [1, 2, 5, 8, 9, 12, 15]
+    indexed = []
+
+    def get_existing_recids(start=-1, end=-1):
+        return [recid for recid in recids
+                if (start == -1 or recid >= start) and (end == -1 or recid <= end)]
+
+    def index_record_ids(record_ids, index=None, refresh=True):
+        if 12 in record_ids and not indexed.count(12):
+            indexed.append(12)
+            raise Exception('Interrupted')
+        indexed.extend(record_ids)
+        return {'publication': record_ids, 'datatable': []}
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.get_existing_recids', side_effect=get_existing_recids), \
+                patch('hepdata.ext.elasticsearch.api.index_record_ids', side_effect=index_record_ids), \
+                patch('hepdata.ext.elasticsearch.api.bump_index_generation') as bump, \
+                patch('hepdata.ext.elasticsearch.api.es') as es:
+            try:
+                reindex_all(batch=2, checkpoint_dir=str(tmpdir))
+            except Exception:
+                pass
+
+            reindex_all(batch=2, workers=1, resume=True, checkpoint_dir=str(tmpdir))
+
+        assert (es.indices.refresh.call_count == 2)
+        assert (bump.call_count == 2)
+
+    assert (sorted(set(indexed)) == recids)
+    assert (indexed.count(8) == 1)
+    assert (tmpdir.listdir() == [])
+
+
+def test_index_record_ids_only_invalidates_searches_after_refresh(app):
+    def generate_index_actions(docs, index, indexed_result):
+        indexed_result['publication'].extend(doc['recid'] for doc in docs)
+        return iter([])
+
+    with app.app_context():
+        with patch('hepdata.modules.records.utils.common.get_records_by_ids', return_value=[{'recid': 1}]), \
+                patch('hepdata.ext.elasticsearch.api.generate_index_actions', side_effect=generate_index_actions), \
+                patch('hepdata.ext.elasticsearch.api.bulk_index', return_value=[]), \
+                patch('hepdata.ext.elasticsearch.api.bump_index_generation') as bump, \
+                patch('hepdata.ext.elasticsearch.api.es') as es:
+            assert (index_record_ids([1], index='hepdata', refresh=False)['publication'] == [1])
+            assert (es.indices.refresh.call_count == 0)
+            assert (bump.call_count == 0)
+
+            index_record_ids([1], index='hepdata')
+            assert (es.indices.refresh.call_count == 1)
+            assert (bump.call_count == 1)
+
+
+def test_delete_item_only_invalidates_searches_after_refresh(app):
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.bump_index_generation') as bump, \
+                patch('hepdata.ext.elasticsearch.api.es') as es:
+            calls = []
+            es.indices.refresh.side_effect = lambda **kwargs: calls.append('refresh')
+            bump.side_effect = lambda: calls.append('bump')
+
+            delete_item_from_index(2, index='hepdata', doc_type='datatable', parent=1, refresh=False)
+            assert (calls == [])
+
+            delete_item_from_index(1, index='hepdata', doc_type='publication')
+            assert (calls == ['refresh', 'bump'])
+
+
+def test_enhance_publication_document_with_context(app):
+    hepsubmission = HEPSubmission(publication_recid=1, version=2)
+    hepsubmission.resources = [DataResource(file_location='ATLAS_2016_I1457605', file_type='rivet'),
+                               DataResource(file_location='http://example.org/code', file_type='html')]
+    context = {'latest_submissions': {1: hepsubmission},
+               'last_submission_events': {1: '2016-05-04'}}
+    doc = {'recid': 1, 'inspire_id': '1457605', 'version': 2, 'authors': [],
+           'creation_date': '2016-01-09', 'year': None}
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.document_enhancers.get_latest_hepsubmission') as get_latest, \
+                patch('hepdata.ext.elasticsearch.document_enhancers.get_last_submission_event') as get_event:
+            enhance_publication_document(doc, context)
+
+            assert (get_latest.call_count == 0)
+            assert (get_event.call_count == 0)
+
+    assert (doc['last_updated'] == '2016-05-04')
+    assert (doc['analyses'] == [{'type': 'rivet', 'analysis': 'ATLAS_2016_I1457605'}])
+    assert (build_enhancement_context([]) == {'latest_submissions': {}, 'last_submission_events': {}})
+
+
+def test_bulk_index_reports_failures(app):
+    actions = [{"_index": "hepdata", "_type": "publication", "_id": 1, "_source": {"recid": 1}},
+               {"_index": "hepdata", "_type": "publication", "_id": 2, "_source": {"recid": 2}}]
+    results = [(True, {"index": {"_type": "publication", "_id": "1", "status": 201}}),
+               (False, {"index": {"_type": "publication", "_id": "2", "status": 400,
+                                  "error": "MapperParsingException"}})]
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.streaming_bulk', return_value=iter(results)) as bulk:
+            failures = bulk_index(iter(actions))
+
+            assert (failures == [results[1][1]])
+            assert (bulk.call_args[1]['chunk_size'] == app.config['INDEX_BULK_CHUNK_SIZE'])
+            assert (bulk.call_args[1]['max_chunk_bytes'] == app.config['INDEX_BULK_MAX_BYTES'])
+            assert (not bulk.call_args[1]['raise_on_error'])
+
+
+def test_reindex_since_advances_high_water_mark(app):
+    redis = FakeRedis()
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.incremental.get_cache_client', return_value=redis), \
+                patch('hepdata.ext.elasticsearch.incremental.get_recids_changed_since',
+                      return_value=[1, 4, 7]) as get_changed, \
+                patch('hepdata.ext.elasticsearch.incremental.index_record_ids') as index_record_ids, \
+                patch('hepdata.ext.elasticsearch.incremental.refresh_index') as refresh_index:
+            assert (reindex_since() is None)
+            assert (get_changed.call_count == 0)
+            assert (refresh_index.call_count == 0)
+            first_mark = get_high_water_mark()
+
+            assert (reindex_since(batch=2) == 3)
+            assert (get_changed.call_args[0][0] == first_mark)
+            assert ([call[0][0] for call in index_record_ids.call_args_list] == [[1, 4], [7]])
+            assert (all(not call[1]['refresh'] for call in index_record_ids.call_args_list))
+            assert (refresh_index.call_count == 1)
+
+            second_mark = get_high_water_mark()
+            assert (second_mark >= first_mark)
+
+            reindex_since(since='2016-07-05T10:00')
+            assert (get_changed.call_args[0][0] == datetime(2016, 7, 5, 10, 0))
+            third_mark = get_high_water_mark()
+            assert (third_mark >= second_mark)
+
+            reindex_since(since='2016-07-05T12:00+02:00')
+            assert (get_changed.call_args[0][0] == datetime(2016, 7, 5, 10, 0))
+            third_mark = get_high_water_mark()
+
+            # starting after the mark would skip the changes in between
+            reindex_since(since='2100-01-01T00:00')
+            assert (get_high_water_mark() == third_mark)
+
+
+def test_utc_to_local_uses_the_offset_at_that_time():
+    try:
+        with patch.dict(os.environ, {'TZ': 'Europe/Zurich'}):
+            time.tzset()
+            assert (_utc_to_local(datetime(2016, 1, 5, 10, 0)) == datetime(2016, 1, 5, 11, 0))
+            assert (_utc_to_local(datetime(2016, 7, 5, 10, 0, 0, 5)) == datetime(2016, 7, 5, 12, 0, 0, 5))
+    finally:
+        time.tzset()
+
+
+def test_swap_index_alias(app):
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.indices.exists_alias.return_value = True
+            es.indices.get_alias.return_value = {'hepdata-20160101000000': {'aliases': {'hepdata': {}}}}
+
+            assert (swap_index_alias('hepdata', 'hepdata-20160201000000') == ['hepdata-20160101000000'])
+            es.indices.update_aliases.assert_called_once_with(body={"actions": [
+                {"remove": {"index": "hepdata-20160101000000", "alias": "hepdata"}},
+                {"add": {"index": "hepdata-20160201000000", "alias": "hepdata"}}]})
+            es.indices.delete.assert_called_once_with(index='hepdata-20160101000000', ignore=404)
+
+        # An index created before the aliases has the name of the alias
+        with patch('hepdata.ext.elasticsearch.api.es') as es:
+            es.indices.exists_alias.return_value = False
+            es.indices.exists.return_value = True
+
+            assert (swap_index_alias('hepdata', 'hepdata-20160201000000') == [])
+            es.indices.delete.assert_called_once_with(index='hepdata')
+            es.indices.update_aliases.assert_called_once_with(body={"actions": [
+                {"add": {"index": "hepdata-20160201000000", "alias": "hepdata"}}]})
+
+
+def test_index_queue_is_bypassed_when_celery_is_eager(app):
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.index_queue.index_record_ids') as index_record_ids, \
+                patch('hepdata.ext.elasticsearch.index_queue.refresh_landing_page_cache'):
+            enqueue_record_ids([4, None, 2])
+            index_record_ids.assert_called_once_with([4, 2])
+
+
+def test_index_queue_coalesces_records(app):
+    redis = MagicMock()
+    redis.set.side_effect = [True, False, True]
+    redis.pipeline.return_value.execute.return_value = [set(['3', '1']), '100.0', 2]
+
+    eager = app.config['CELERY_ALWAYS_EAGER']
+    app.config['CELERY_ALWAYS_EAGER'] = False
+    try:
+        with app.app_context():
+            with patch('hepdata.ext.elasticsearch.index_queue.get_cache_client', return_value=redis), \
+                    patch('hepdata.ext.elasticsearch.tasks.flush_index_queue') as flush_task, \
+                    patch('hepdata.ext.elasticsearch.index_queue.index_record_ids') as index_record_ids, \
+                    patch('hepdata.ext.elasticsearch.index_queue.refresh_landing_page_cache'):
+                enqueue_record_ids([1])
+                enqueue_record_ids([3, 1])
+
+                assert (index_record_ids.call_count == 0)
+                flush_task.apply_async.assert_called_once_with(countdown=app.config['INDEX_QUEUE_WINDOW'])
+
+                assert (flush() == 2)
+                index_record_ids.assert_called_once_with([1, 3])
+    finally:
+        app.config['CELERY_ALWAYS_EAGER'] = eager
+
+
+def test_index_queue_gives_up_after_max_attempts(app):
+    redis = MagicMock()
+    pipeline = redis.pipeline.return_value
+    # queued records, then their failure counts, then moving one to the failed set
+    pipeline.execute.side_effect = [[set(['2', '1']), '100.0', 2], [5, 1], [1, 1]]
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.index_queue.get_cache_client', return_value=redis), \
+                patch('hepdata.ext.elasticsearch.index_queue.enqueue_record_ids') as enqueue, \
+                patch('hepdata.ext.elasticsearch.index_queue.index_record_ids', side_effect=Exception('ES down')), \
+                patch('hepdata.ext.elasticsearch.index_queue.refresh_landing_page_cache'):
+            with pytest.raises(Exception):
+                flush()
+
+            enqueue.assert_called_once_with([2])
+            assert (pipeline.sadd.call_args[0][1:] == (1,))
+
+
+def test_filter_facets_keeps_rare_keywords():
+    facets = [{'type': 'observables', 'vals': [{'key': 'SIG', 'doc_count': 2}]},
+              {'type': 'reactions', 'vals': []}]
+
+    assert (filter_facets(facets) == [facets[0]])
+
+
+def test_search_view_with_cursor(app):
+    first_page = {'results': [{'recid': 1}], 'total': 2, 'scroll_id': 'cursor-1'}
+    next_page = {'results': [{'recid': 2}], 'total': 2, 'scroll_id': 'cursor-2'}
+
+    with app.test_client() as client:
+        with patch('hepdata.modules.search.views.es_search', return_value=first_page) as search_mock:
+            response = client.get('/search/?q=higgs&format=json&scroll=1')
+            assert (response.status_code == 200)
+            result = json.loads(response.data)
+            assert (result['cursor'] == 'cursor-1')
+            assert (result['hits'] == {'total': 2})
+            assert (search_mock.call_args[1]['scroll'])
+
+        with patch('hepdata.modules.search.views.es_scroll_search', return_value=next_page) as scroll_mock:
+            response = client.get('/search/?format=json&cursor=cursor-1')
+            assert (response.status_code == 200)
+            assert (json.loads(response.data)['results'] == [{'recid': 2}])
+            assert (scroll_mock.call_args[0][0] == 'cursor-1')
+
+
+def test_search_view_with_expired_cursor(app):
+    with app.test_client() as client:
+        with patch('hepdata.modules.search.views.es_scroll_search',
+                   side_effect=NotFoundError(404, 'search_context_missing_exception')):
+            response = client.get('/search/?format=json&cursor=expired')
+            assert (response.status_code == 404)
+            result = json.loads(response.data)
+            assert (not result['success'])
+            assert ('scroll=1' in result['message'])
+
+
+def test_search_export_view(app):
+    publications = [{'recid': 1, 'data': []}, {'recid': 2, 'data': [{'recid': 3}]}]
+
+    with app.test_client() as client:
+        with patch('hepdata.modules.search.views.es_iterate_search', return_value=iter(publications)):
+            response = client.get('/search/export?q=higgs')
+            assert (response.status_code == 200)
+            assert (response.mimetype == 'application/x-ndjson')
+            lines = response.data.decode('utf-8').strip().split('\n')
+            assert ([json.loads(line) for line in lines] == publications)
+
+
+def test_remove_missing_records(app):
+    hits = [{'_type': 'publication', '_id': '1'},
+            {'_type': 'publication', '_id': '2'},
+            {'_type': 'datatable', '_id': '3', 'fields': {'_parent': '2'}}]
+    actions = []
+
+    with app.app_context():
+        with patch('hepdata.ext.elasticsearch.api.get_existing_recids', return_value=[1]), \
+                patch('hepdata.ext.elasticsearch.api.scan', return_value=iter(hits)), \
+                patch('hepdata.ext.elasticsearch.api.bulk_index', side_effect=actions.extend), \
+                patch('hepdata.ext.elasticsearch.api.bump_index_generation'), \
+                patch('hepdata.ext.elasticsearch.api.es') as es:
+            assert (remove_missing_records(index='hepdata') == [2, 3])
+            assert (es.indices.refresh.call_count == 1)
+
+    assert (actions == [
+        {'_op_type': 'delete', '_index': 'hepdata', '_type': 'publication', '_id': '2'},
+        {'_op_type': 'delete', '_index': 'hepdata', '_type': 'datatable', '_id': '3', '_parent': '2'}])